@@ -1,44 +1,256 @@
-from flask import Flask, jsonify, request
-from dbmanager import db, MobilePhone
-from sqlalchemy.exc import IntegrityError
-from read_config import get_database_uri
-from phoneValidator import (
-    validate_serial_number,
-    validate_imei,
-    validate_model,
-    validate_brand,
-    validate_network_technologies,
-    validate_number_of_cameras,
-    validate_number_of_cores,
-    validate_weight,
-    validate_battery_capacity,
-    validate_cost,
+import hashlib
+import queue
+from functools import wraps
+
+import click
+from flask import Blueprint, Flask, Response, abort, g, jsonify, make_response, request, stream_with_context, url_for, current_app
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+from dbmanager import (
+    db, MobilePhone, PUBLIC_FIELDS, AGGREGATE_DIMENSIONS, masks_including, apply_aggregate_changes,
+    bump_catalogue_version, catalogue_stats, get_catalogue_version, init_schema, MonitoredQueuePool, pool_stats,
+    record_deletions,
 )
+from sqlalchemy import make_url, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from read_config import as_bool, get_database_uri, get_engine_options, get_replica_uris, get_setting
+from replica import ReplicaRouter, mark_primary_reads, read_only
+from serializer import get_json_provider_class, phone_etag, row_to_dict, select_phones
+from export import FORMATS as EXPORT_FORMATS, export_rows
+from bulk_ingest import ingest_phones, parse_records
+from bulk_update import delete_phones as apply_delete, update_phones as apply_update
+from phone_query import build_query, parse_fields, parse_filters
+from metrics import init_app as init_metrics, timed_json_provider
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, PhoneSearch, tokenize
+from idempotency import idempotent
+from cache import CACHEABLE_FILTERS, create_cache, filter_key, keys_for_phone, phone_key
+from signals import phones_changed
+from phoneValidator import ALLOWED_NETWORKS, PHONE_VALIDATOR, ValidationError, validate_update
+
+# Routes live on a blueprint so create_app() can build as many apps as needed
+# (one per gunicorn worker, one per test configuration).
+api = Blueprint('api', __name__)
+
+def create_app(config=None):
+    """Build the Flask app without touching the database.
+
+    The schema is managed by ``flask --app MainInterface init-db``; set
+    ``[database] auto_create_schema = true`` to run it at startup instead.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri()
+    # Example: sqlite:///app.db
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['INGEST_CHUNK_SIZE'] = get_setting('ingest', 'chunk_size', default=1000, cast=int)
+    app.config['EXPORT_CHUNK_SIZE'] = get_setting('export', 'chunk_size', default=5000, cast=int)
+    app.config['AUTO_CREATE_SCHEMA'] = get_setting('database', 'auto_create_schema', default=False, cast=as_bool)
+    app.config['METRICS_ENABLED'] = get_setting('metrics', 'enabled', default=True, cast=as_bool)
+    app.config['SLOW_QUERY_MS'] = get_setting('metrics', 'slow_query_ms', default=0, cast=float)
+    app.config['SEARCH_BACKEND'] = get_setting('search', 'backend', default='auto')
+    app.config['WRITE_BEHIND_MODE'] = get_setting('write_behind', 'mode', default='off')
+    app.config['WRITE_BEHIND_JOURNAL_DIR'] = get_setting('write_behind', 'journal_dir', default='') or None
+    app.config['IDEMPOTENCY_LEASE'] = get_setting('idempotency', 'lease', default=60, cast=int)
+    app.config['SNAPSHOT_ENABLED'] = get_setting('snapshot', 'enabled', default=False, cast=as_bool)
+    app.config['SNAPSHOT_REFRESH_INTERVAL'] = get_setting('snapshot', 'refresh_interval', default=1.0, cast=float)
+    app.config.update(config or {})
+
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    engine_options = get_engine_options(database_uri)
+    if 'pool_size' in engine_options:
+        engine_options['poolclass'] = MonitoredQueuePool
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options)
+    # Replicas are plain binds without models, so create_all() never touches them.
+    replica_uris = get_replica_uris()
+    app.config.setdefault('SQLALCHEMY_BINDS', {f"replica_{i}": uri for i, uri in enumerate(replica_uris)})
+
+    provider_class = get_json_provider_class(get_setting('json', 'provider', default='auto'))
+    if app.config['METRICS_ENABLED']:
+        provider_class = timed_json_provider(provider_class)
+    app.json = provider_class(app)
+    db.init_app(app)
+    app.register_blueprint(api)
+    app.after_request(mark_primary_reads)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(export_command)
+
+    # Read-through cache for /phone/<serial_number> and /phones/<field>/<value> responses.
+    app.extensions['phone_cache'] = create_cache(
+        backend=get_setting('cache', 'backend', default='lru'),
+        maxsize=get_setting('cache', 'maxsize', default=1024, cast=int),
+        ttl=get_setting('cache', 'ttl', default=60, cast=int),
+    )
+    # Responses of writes sent with an Idempotency-Key, replayed to retries (see idempotency.py).
+    app.extensions['idempotency_store'] = create_cache(
+        backend=get_setting('idempotency', 'backend', default='lru'),
+        maxsize=get_setting('idempotency', 'maxsize', default=10000, cast=int),
+        ttl=get_setting('idempotency', 'ttl', default=86400, cast=int),
+        prefix='phone-api-idempotency:',
+    )
+    if app.config['WRITE_BEHIND_MODE'] not in ('off', 'prefer', 'always'):
+        raise ValueError(f"Unknown write_behind mode '{app.config['WRITE_BEHIND_MODE']}'. "
+                         "Expected 'off', 'prefer' or 'always'.")
+    if app.config['WRITE_BEHIND_MODE'] != 'off':
+        # Queue for asynchronous /add_phone; its writer thread starts with the first request.
+        from write_behind import WriteBehind
+
+        writer = app.extensions['write_behind'] = WriteBehind(
+            app,
+            statuses=create_cache(
+                backend=get_setting('write_behind', 'status_backend', default='lru'),
+                maxsize=get_setting('write_behind', 'status_maxsize', default=100000, cast=int),
+                ttl=get_setting('write_behind', 'status_ttl', default=86400, cast=int),
+                prefix='phone-api-ingest:',
+            ),
+            max_size=get_setting('write_behind', 'queue_size', default=10000, cast=int),
+            max_batch=get_setting('write_behind', 'max_batch', default=500, cast=int),
+            max_latency_ms=get_setting('write_behind', 'max_latency_ms', default=20, cast=float),
+            journal_dir=app.config['WRITE_BEHIND_JOURNAL_DIR'],
+            fsync=get_setting('write_behind', 'fsync', default=False, cast=as_bool),
+        )
+        # Also replays the journals of crashed workers as soon as this one serves a request.
+        app.before_request(writer.ensure_started)
+    # Type-ahead search for /phones/search; the backend is picked on the first query.
+    app.extensions['phone_search'] = PhoneSearch(
+        backend=app.config['SEARCH_BACKEND'],
+        rebuild_interval=get_setting('search', 'trie_rebuild_interval', default=300, cast=int),
+    )
+    if app.config['SNAPSHOT_ENABLED']:
+        # Columnar copy of mobile_phones for the GET routes; loaded by the first read.
+        from snapshot import CatalogueSnapshot
+
+        app.extensions['catalogue_snapshot'] = CatalogueSnapshot(
+            refresh_interval=app.config['SNAPSHOT_REFRESH_INTERVAL'],
+            exact_strings=make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite')
+    with app.app_context():
+        # Creating engines does not connect; the first query does.
+        app.extensions['replica_router'] = ReplicaRouter(
+            [db.engines[key] for key in app.config['SQLALCHEMY_BINDS']],
+            retry_after=get_setting('database', 'replica_retry_after', default=30, cast=int),
+            read_after_write_window=get_setting('database', 'read_after_write_window', default=5, cast=int),
+        )
+        if app.config['METRICS_ENABLED']:
+            # Per-route latency, SQL and serialization counters at /metrics.
+            init_metrics(app, db.engines.values(), slow_query_ms=app.config['SLOW_QUERY_MS'])
+        if app.config['AUTO_CREATE_SCHEMA']:
+            init_schema(db.engine)
+            # gunicorn preloads the app in the master; forked workers must not
+            # inherit the pooled connection init_schema used.
+            db.engine.dispose()
+    return app
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create missing tables and indexes and backfill derived columns."""
+    for index in init_schema(db.engine):
+        click.echo(f"Created index {index.name} on {index.table.name} "
+                   f"({', '.join(column.name for column in index.columns)})")
+    click.echo("Schema is up to date.")
+
+@click.command('export')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help="File to write; stdout by default.")
+@click.option('--gzip', 'compress', is_flag=True, help="Compress the output with gzip.")
+@click.option('--chunk-size', type=int, default=None, help="Rows fetched from the cursor at a time.")
+@with_appcontext
+def export_command(fmt, output, compress, chunk_size):
+    """Stream the whole catalogue to a file in id order."""
+    chunk_size = chunk_size or current_app.config['EXPORT_CHUNK_SIZE']
+    statement = select_phones().order_by(MobilePhone.id)
+    for piece in export_rows(db.session, statement, PUBLIC_FIELDS, fmt, chunk_size, compress):
+        output.write(piece)
+
+def response_cache():
+    return current_app.extensions['phone_cache']
+
+@phones_changed.connect
+def invalidate_cached_phones(sender, before=(), after=()):
+    # Drop exactly the entries that could contain one of the changed phones,
+    # using both the old and the new values of every field. The sender is the app.
+    keys = set()
+    for phone in [*before, *after]:
+        keys.update(keys_for_phone(phone))
+    sender.extensions['phone_cache'].delete(*keys)
+
+def catalogue_snapshot():
+    # The in-memory snapshot (see snapshot.py) when it is enabled and loaded,
+    # refreshed at most once per request; None sends the view to the database.
+    snapshot = current_app.extensions.get('catalogue_snapshot')
+    if snapshot is None:
+        return None
+    if 'catalogue_snapshot' not in g:
+        g.catalogue_snapshot = snapshot if snapshot.current(db.session) else None
+    return g.catalogue_snapshot
+
+def conditional_on_catalogue(view):
+    """Serve a GET view with a strong ETag derived from the catalogue version.
 
-import configparser
+    The version row is read before the view runs, so the ETag is never newer
+    than the body. A matching If-None-Match gets a 304 without touching
+    mobile_phones at all. With the snapshot enabled its version is used, so
+    the ETag matches what the snapshot serves.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        snapshot = catalogue_snapshot()
+        version = snapshot.version if snapshot is not None else get_catalogue_version(db.session)
+        g.catalogue_version = version  # lets the view reject cache entries older than this ETag
+        digest = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+        etag = f"{version}-{digest}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
 
-# config = configparser.ConfigParser()
-# config.read('config.properties')
-database_uri = get_database_uri()
-# Example: sqlite:///app.db
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+    return wrapper
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+def phone_response(phone, status=200):
+    response = jsonify(phone)
+    response.status_code = status
+    response.set_etag(phone_etag(phone))
+    return response
 
-with app.app_context():
-    db.create_all()
+# If-Match check for writes to one phone; returns a 412 response when the client's copy is stale.
+def precondition_failed(phone):
+    if not request.if_match or request.if_match.contains(phone_etag(phone)):
+        return None
+    response = jsonify({"error": "The phone has changed; fetch it again and retry with its new ETag."})
+    response.status_code = 412
+    response.set_etag(phone_etag(phone))
+    return response
 
-@app.route('/')
+def conflict():
+    # The row version moved between our read and our write (see MobilePhone.version).
+    db.session.rollback()
+    return jsonify({"error": "The phone was changed by another request; fetch it again and retry."}), 409
+
+# Name the unique field a new phone collides with by looking it up, rather
+# than parsing the driver's error text (which differs between databases).
+def duplicate_phone_message(data):
+    if db.session.scalar(select(MobilePhone.id).where(MobilePhone.serial_number == data['serial_number'])):
+        return "A phone with this serial number already exists."
+    if db.session.scalar(select(MobilePhone.id).where(MobilePhone.imei == data['imei'])):
+        return "A phone with this IMEI already exists."
+    return "The phone conflicts with an existing record."
+
+@api.route('/')
 def index():
     return "Welcome to the Phone API!"
 
 # Endpoint to add a new phone record
-@app.route('/add_phone', methods=['POST'])
+@api.route('/add_phone', methods=['POST'])
+@idempotent
 def add_phone():
     data = request.get_json()
+    if wants_write_behind():
+        return queue_phone(data)
     try:
+        bump_catalogue_version(db.session)
         # Validate and convert the input data.
         phone = MobilePhone(
             serial_number=data['serial_number'],
@@ -53,35 +265,210 @@ def add_phone():
             cost=data['cost']
         )
         db.session.add(phone)
+        apply_aggregate_changes(db.session, after=[phone.to_dict()])
         db.session.commit()
-        return jsonify(phone.to_dict()), 201
+        phones_changed.send(current_app._get_current_object(), before=[], after=[phone.to_dict()])
+        return phone_response(phone.to_dict(), 201)
     except KeyError as e:
         db.session.rollback()
         return jsonify({"error": f"Missing required field: {str(e)}"}), 400
-    except IntegrityError as e:
+    except IntegrityError:
         db.session.rollback()  # Roll back the failed transaction.
-        error_message = str(e.orig) if hasattr(e, 'orig') else str(e)
-        # Check for specific constraint violations.
-        if "mobile_phones.serial_number" in error_message:
-            friendly_message = "A phone with this serial number already exists."
-        elif "mobile_phones.imei" in error_message:
-            friendly_message = "A phone with this IMEI already exists."
-        
-        return jsonify({"error": friendly_message}), 400
+        return jsonify({"error": duplicate_phone_message(data)}), 400
     except Exception as e:
         # logging the error can be helpful for debugging.
-        app.logger.error(f"Error adding phone: {str(e)}")
+        current_app.logger.error(f"Error adding phone: {str(e)}")
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
         
 
 
-# Endpoint to retrieve all phone records
-@app.route('/phones', methods=['GET'])
-@app.route('/phone/', methods=['GET'])
+def wants_write_behind():
+    mode = current_app.config['WRITE_BEHIND_MODE']
+    return mode == 'always' or (mode == 'prefer' and 'respond-async' in request.headers.get('Prefer', ''))
+
+# Asynchronous /add_phone: validate now, write with the next group commit (see write_behind.py).
+def queue_phone(data):
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    _, errors = PHONE_VALIDATOR.check(data)
+    if errors:
+        error = ValidationError(errors)
+        return jsonify({"error": str(error), "errors": error.errors}), 400
+    try:
+        tracking_id = current_app.extensions['write_behind'].submit(data)
+    except queue.Full:
+        return jsonify({"error": "The ingest queue is full; retry shortly."}), 503, {'Retry-After': '1'}
+    location = url_for('api.ingest_status', tracking_id=tracking_id)
+    return jsonify({"id": tracking_id, "status": "queued", "status_url": location}), 202, {'Location': location}
+
+# Endpoint reporting a phone queued by asynchronous /add_phone: queued, inserted or rejected
+@api.route('/ingest/<string:tracking_id>', methods=['GET'])
+def ingest_status(tracking_id):
+    writer = current_app.extensions.get('write_behind')
+    status = writer.status(tracking_id) if writer is not None else None
+    if status is None:
+        return jsonify({"error": "Unknown tracking id."}), 404
+    return jsonify(status), 200
+
+# Endpoint exposing the write-behind queue depth and group-commit counters
+@api.route('/ingest/stats', methods=['GET'])
+def ingest_stats():
+    writer = current_app.extensions.get('write_behind')
+    if writer is None:
+        return jsonify({"mode": "off"}), 200
+    return jsonify(dict(writer.stats(), mode=current_app.config['WRITE_BEHIND_MODE'])), 200
+
+# Endpoint to add many phone records at once.
+# Body is a JSON array or NDJSON (Content-Type: application/x-ndjson).
+# ?mode=atomic (default) writes nothing unless every record is valid;
+# ?mode=partial writes the valid records and reports the rest.
+@api.route('/add_phones', methods=['POST'])
+@idempotent
+def add_phones():
+    mode = request.args.get('mode', 'atomic')
+    if mode not in ('atomic', 'partial'):
+        return jsonify({"error": "mode must be 'atomic' or 'partial'."}), 400
+    try:
+        chunk_size = int_arg(request.args.get('chunk_size')) or current_app.config['INGEST_CHUNK_SIZE']
+        records = parse_records(request.get_data(), request.content_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        report = ingest_phones(records, chunk_size=chunk_size, atomic=(mode == 'atomic'))
+    except Exception as e:
+        current_app.logger.error(f"Error adding phones: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    if not report['errors']:
+        status = 201
+    elif report['inserted']:
+        status = 207
+    else:
+        status = 400
+    return jsonify(report), status
+
+# Helper to parse optional non-negative integer query parameters
+def int_arg(value):
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"Expected a non-negative integer, got '{value}'.")
+    return int(value)
+
+# Largest page a client may request with ?limit=, and how many rows the
+# streaming mode pulls from the server-side cursor at a time.
+MAX_PAGE_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+
+def stream_phones(statement):
+    # Yield a JSON array piece by piece so only one batch of rows is held in memory.
+    rows = db.session.execute(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+    dumps = current_app.json.dumps
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + dumps(row_to_dict(row))
+    yield "]"
+
+# Endpoint to retrieve all phone records.
+# Supports keyset pagination with ?limit=<n>&after=<id>; the id to pass as
+# 'after' for the next page is returned in the X-Next-After header.
+# Without a limit the whole catalogue is streamed in id order.
+@api.route('/phones', methods=['GET'])
+@api.route('/phone/', methods=['GET'])
+@read_only
+@conditional_on_catalogue
 def get_phones():
-    phones = MobilePhone.query.all()
-    return jsonify([phone.to_dict() for phone in phones]), 200
+    try:
+        limit = int_arg(request.args.get('limit'))
+        after = int_arg(request.args.get('after')) or 0
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    snapshot = catalogue_snapshot()
+    statement = select_phones().where(MobilePhone.id > after).order_by(MobilePhone.id)
+    if limit is None:
+        chunks = snapshot.stream(current_app.json.dumps, after) if snapshot is not None else stream_phones(statement)
+        return Response(stream_with_context(chunks), 200, mimetype='application/json')
+
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_LIMIT}."}), 400
+    if snapshot is not None:
+        phones = snapshot.page(after, limit)
+    else:
+        phones = [row_to_dict(phone) for phone in db.session.execute(statement.limit(limit))]
+    response = jsonify(phones)
+    if len(phones) == limit:
+        response.headers['X-Next-After'] = str(phones[-1]['id'])
+    return response, 200
+
+# Endpoint to search phones with several filters, ranges and projections, e.g.
+# /phones/query?network_technologies=5G&cost__lt=500&number_of_cores__gte=8&fields=brand,model,cost&sort=-cost
+@api.route('/phones/query', methods=['GET'])
+@read_only
+@conditional_on_catalogue
+def query_phones():
+    snapshot = catalogue_snapshot()
+    try:
+        phones = snapshot.query(request.args) if snapshot is not None else None
+        if phones is not None:
+            return jsonify(phones), 200
+        statement, fields = build_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = db.session.execute(statement)
+    return jsonify([row_to_dict(row, fields) for row in rows]), 200
+
+# Endpoint to export the catalogue for analytics, e.g.
+# /phones/export?format=csv&brand=Nokia&fields=brand,model,cost
+# Formats: ndjson (default), csv and columnar (see export.py). Accepts the
+# /phones/query filters and fields= (not sort= or limit=); rows are streamed in
+# id order and gzipped when the client sends Accept-Encoding: gzip.
+@api.route('/phones/export', methods=['GET'])
+@read_only
+def export_phones():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}."}), 400
+    for param in ('sort', 'limit'):
+        if param in request.args:
+            return jsonify({"error": f"{param} is not supported; exports stream every matching phone in id order."}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        conditions = parse_filters(MultiDict([(key, value) for key, value in request.args.items(multi=True)
+                                              if key != 'format']))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    statement = select_phones(fields).where(*conditions).order_by(MobilePhone.id)
+    compress = bool(request.accept_encodings['gzip'])
+    pieces = export_rows(db.session, statement, fields, fmt, current_app.config['EXPORT_CHUNK_SIZE'], compress)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    response = Response(stream_with_context(pieces), 200, content_type=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="phones.{extension}"'
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+# Endpoint for type-ahead search on brand and model, e.g. /phones/search?q=sam+gal&limit=5
+# Every query word must start a brand or model word; results are ranked (see search.py).
+@api.route('/phones/search', methods=['GET'])
+@read_only
+@conditional_on_catalogue
+def search_phones():
+    query = request.args.get('q', '')
+    try:
+        limit = int_arg(request.args.get('limit', str(DEFAULT_SEARCH_LIMIT)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {MAX_SEARCH_LIMIT}."}), 400
+    if not tokenize(query):
+        return jsonify({"error": "q must contain at least one letter or digit."}), 400
+    return jsonify(current_app.extensions['phone_search'].search(db.session, query, limit)), 200
 
 # Helper function for type conversion
 def convert_field_value(field, value):
@@ -90,70 +477,135 @@ def convert_field_value(field, value):
         'number_of_cores': int,
         'weight': int,
         'battery_capacity': int,
-        'cost': float
+        'cost': float,
+        'id': int,
+        'version': int,
     }
     if field in conversion_funcs:
         return conversion_funcs[field](value)
     return value
 
-# Endpoint to update a phone record
-@app.route('/update_phone/<string:serial_number>', methods=['PUT'])
+# Endpoint to update a phone record.
+# Send If-Match with the phone's ETag to update only the version you read (412 otherwise).
+@api.route('/update_phone/<string:serial_number>', methods=['PUT'])
+@idempotent
 def update_phone(serial_number):
     data = request.get_json()
     phone = MobilePhone.query.filter_by(serial_number=serial_number).first_or_404()
+    before = phone.to_dict()
+    failed = precondition_failed(before)
+    if failed is not None:
+        return failed
     try:
-        restricted_fields = ['serial_number', 'imei', 'model', 'brand']
-        for field, value in data.items():
-            if field in restricted_fields:
-                return jsonify({"error": f"Updating '{field}' is not allowed."}), 400
-            if field in MobilePhone.__table__.columns.keys():
-                if field == 'network_technologies':
-                    try:
-                        validate_network_technologies(value)
-                        conVal = ",".join(value)
-                        setattr(phone, field, conVal)
-                    except ValueError:
-                        return jsonify({"error": f"Invalid type for field {field}."+str(e)}), 400
-                else:
-                    try:
-                        conVal = convert_field_value(field, value)
-                        
-                        # Validate the value using the appropriate validator from phoneValidator.py
-                        validator_function = globals().get(f"validate_{field}")
-                        if validator_function:
-                            validator_function(value)
-                        
-                        setattr(phone, field, conVal)
-                    except ValueError:
-                        return jsonify({"error": f"Invalid type for field {field}. Expected {convert_field_value.__annotations__.get(field, 'appropriate type')}."}), 400
-            else:
-                return jsonify({"error": f"Invalid field: {field}"}), 400
-            
+        values = validate_update(data)
+    except ValidationError as e:
+        return jsonify({"error": str(e), "errors": e.errors}), 400
+    try:
+        bump_catalogue_version(db.session)
+        for field, value in values.items():
+            setattr(phone, field, value)
+        apply_aggregate_changes(db.session, before=[before], after=[phone.to_dict()])
         db.session.commit()
-        return jsonify(phone.to_dict()), 200
+        phones_changed.send(current_app._get_current_object(), before=[before], after=[phone.to_dict()])
+        return phone_response(phone.to_dict())
+    except StaleDataError:
+        return conflict()
     except Exception as e:
-        app.logger.error(f"Error updating phone: {str(e)}")
+        current_app.logger.error(f"Error updating phone: {str(e)}")
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
 
-# Endpoint to delete a phone record
-@app.route('/delete_phone/<string:serial_number>', methods=['DELETE'])
+# Endpoint to delete a phone record; If-Match works as for updates
+@api.route('/delete_phone/<string:serial_number>', methods=['DELETE'])
+@idempotent
 def delete_phone(serial_number):
     phone = MobilePhone.query.filter_by(serial_number=serial_number).first_or_404()
-    db.session.delete(phone)
-    db.session.commit()
+    before = phone.to_dict()
+    failed = precondition_failed(before)
+    if failed is not None:
+        return failed
+    try:
+        bump_catalogue_version(db.session)
+        db.session.delete(phone)
+        record_deletions(db.session, [before['id']])
+        apply_aggregate_changes(db.session, before=[before])
+        db.session.commit()
+    except StaleDataError:
+        return conflict()
+    phones_changed.send(current_app._get_current_object(), before=[before], after=[])
     return jsonify({"message": "Phone deleted successfully"}), 200
 
-# Endpoint to retrieve a specific phone record
-@app.route('/phone/<string:serial_number>', methods=['GET'])
+# Status for bulk update/delete reports: every phone changed, some, or none.
+def bulk_status(report):
+    if not report['not_found']:
+        return 200
+    return 404 if report['not_found'] == len(report['results']) else 207
+
+# Endpoint to apply one patch to many phones, e.g.
+# {"serial_numbers": ["ABC12345678", ...], "patch": {"cost": 249.0}} or
+# {"filter": {"brand": "Nokia", "cost__lt": 300}, "patch": {"cost": 249.0}}
+@api.route('/update_phones', methods=['PUT'])
+@idempotent
+def update_phones():
+    try:
+        report = apply_update(request.get_json(silent=True))
+    except ValidationError as e:
+        return jsonify({"error": str(e), "errors": e.errors}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report), bulk_status(report)
+
+# Endpoint to delete many phones: {"serial_numbers": [...]} or {"filter": {...}}
+@api.route('/delete_phones', methods=['DELETE'])
+@idempotent
+def delete_phones():
+    try:
+        report = apply_delete(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report), bulk_status(report)
+
+# Endpoint to retrieve a specific phone record.
+# Its ETag is the row version, usable for If-None-Match here and If-Match on writes.
+@api.route('/phone/<string:serial_number>', methods=['GET'])
+@read_only
 def get_phone(serial_number):
-    phone = MobilePhone.query.filter_by(serial_number=serial_number).first_or_404()
-    return jsonify(phone.to_dict()), 200
+    key = phone_key(serial_number)
+    cache = response_cache()
+    snapshot = catalogue_snapshot()
+    phone = snapshot.phone(serial_number) if snapshot is not None else None
+    if phone is not None:
+        body = current_app.json.dumps(phone)
+    elif snapshot is not None and snapshot.exact_strings:
+        abort(404)
+    else:
+        # Without the snapshot, or when the database may match the serial number differently.
+        # Entries record the catalogue version, so writes made through other workers make them stale.
+        g.catalogue_version = get_catalogue_version(db.session)
+        body = cache.get_versioned(key, g.catalogue_version)
+    if body is None:
+        phone = db.session.execute(select_phones().where(MobilePhone.serial_number == serial_number)).first()
+        if phone is None:
+            abort(404)
+        phone = row_to_dict(phone)
+        body = current_app.json.dumps(phone)
+        cache.set_versioned(key, g.catalogue_version, body)
+    elif phone is None:
+        phone = current_app.json.loads(body)
+    etag = phone_etag(phone)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, 200, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 # Endpoint to retrieve phones by a specific field and value
-@app.route('/phones/<string:field>/<string:value>', methods=['GET'])
+@api.route('/phones/<string:field>/<string:value>', methods=['GET'])
+@read_only
+@conditional_on_catalogue
 def get_phones_by_field(field, value):
-    if field not in MobilePhone.__table__.columns.keys():
+    if field not in PUBLIC_FIELDS:
         return jsonify({"error": "Invalid field"}), 400
 
     try:
@@ -161,16 +613,75 @@ def get_phones_by_field(field, value):
     except ValueError:
         return jsonify({"error": f"Invalid type for field {field}. Expected {convert_field_value.__annotations__.get(field, 'appropriate type')}."}), 400
 
+    if field == 'network_technologies' and value not in ALLOWED_NETWORKS:
+        return jsonify({"error": f"Network technologies must be among: {', '.join(ALLOWED_NETWORKS)}."}), 400
+
+    snapshot = catalogue_snapshot()
+    if snapshot is not None:
+        criterion = (field, 'eq', [value] if field == 'network_technologies' else converted_value)
+        phones = snapshot.select([criterion])
+        if phones is not None:
+            return Response(current_app.json.dumps(phones), 200, mimetype='application/json')
+
+    # The key uses the converted value, so /phones/cost/300 and /phones/cost/300.0 share an entry.
+    key = filter_key(field, converted_value) if field in CACHEABLE_FILTERS else None
+    cache = response_cache()
+    body = cache.get_versioned(key, g.catalogue_version) if key else None
+    if body is not None:
+        return Response(body, 200, mimetype='application/json')
+
     if field == 'network_technologies':
-        search_value = f"%{value}%"
-        phones = MobilePhone.query.filter(MobilePhone.network_technologies.like(search_value)) \
-                                  .order_by(MobilePhone.brand, MobilePhone.model, MobilePhone.cost).all()
+        condition = MobilePhone.network_mask.in_(masks_including(value))
     else:
-        phones = MobilePhone.query.filter(getattr(MobilePhone, field) == converted_value) \
-                                  .order_by(MobilePhone.brand, MobilePhone.model, MobilePhone.cost).all()
+        condition = getattr(MobilePhone, field) == converted_value
+    phones = db.session.execute(select_phones().where(condition)
+                                .order_by(MobilePhone.brand, MobilePhone.model, MobilePhone.cost))
+
+    body = current_app.json.dumps([row_to_dict(phone) for phone in phones])
+    if key:
+        cache.set_versioned(key, g.catalogue_version, body)
+    return Response(body, 200, mimetype='application/json')
+
+# Endpoint returning phone counts and average/min/max cost per brand, network
+# technology and core count, read from the incrementally maintained aggregates.
+# ?dimension=brand (repeatable) restricts the output.
+@api.route('/phones/stats', methods=['GET'])
+@read_only
+@conditional_on_catalogue
+def get_phone_stats():
+    dimensions = request.args.getlist('dimension') or AGGREGATE_DIMENSIONS
+    for dimension in dimensions:
+        if dimension not in AGGREGATE_DIMENSIONS:
+            return jsonify({"error": f"dimension must be among: {', '.join(AGGREGATE_DIMENSIONS)}."}), 400
+    return jsonify(catalogue_stats(db.session, dimensions)), 200
+
+# Endpoint exposing connection pool usage (checked out, overflow, waits) for the primary and replicas
+@api.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    stats = pool_stats(db.engine)
+    router = current_app.extensions['replica_router']
+    stats['replicas'] = [dict(replica, **pool_stats(engine)) for replica, engine in zip(router.stats(), router.engines)]
+    return jsonify(stats), 200
+
+# Endpoint exposing the in-memory snapshot's version, refresh counters and memory per column
+@api.route('/snapshot/stats', methods=['GET'])
+def snapshot_stats():
+    snapshot = current_app.extensions.get('catalogue_snapshot')
+    if snapshot is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(snapshot.stats(), enabled=True)), 200
+
+# Endpoint exposing cache hit/miss counters
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache().stats()), 200
 
-    return jsonify([phone.to_dict() for phone in phones]), 200
 
+app = create_app()
+phone_cache = app.extensions['phone_cache']
 
 if __name__ == '__main__':
+    # The development server creates the schema itself; deployments run init-db.
+    with app.app_context():
+        init_schema(db.engine)
     app.run(debug=True)
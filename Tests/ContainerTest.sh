@@ -2,7 +2,7 @@
 set -e
 
 # Define the API URI (adjust as needed for Minikube)
-API_URI="http://192.168.49.2:31236"  # Replace with your Minikube IP and NodePort or the docker container IP
+API_URI="${API_URI:-http://192.168.49.2:31236}"  # Override with API_URI=... (Minikube IP and NodePort, or the docker container IP)
 
 # Wait for the API to start
 echo "Waiting for the API to be ready..."
@@ -0,0 +1,427 @@
+"""ASGI entry point serving the phone routes on SQLAlchemy's async engine.
+
+Run with an ASGI server, e.g. ``uvicorn asgi_app:app`` or
+``gunicorn -k uvicorn.workers.UvicornWorker asgi_app:app`` (set
+``[server] mode = asgi`` to have gunicorn.conf.py pick it). While a request
+waits on the database the event loop keeps serving other requests, so one
+process can have many queries in flight.
+"""
+import hashlib
+import json
+import os
+import re
+from urllib.parse import parse_qsl
+
+from sqlalchemy import delete, make_url, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+
+from cache import create_cache
+from dbmanager import (
+    db, MobilePhone, PUBLIC_FIELDS, AGGREGATE_DIMENSIONS, apply_aggregate_changes, bump_catalogue_version,
+    catalogue_stats, catalogue_version_query, masks_including, record_deletions,
+)
+from idempotency import IdempotencyError, claim, finish, request_fingerprint, store_key
+from phoneValidator import ALLOWED_NETWORKS, ValidationError, validate_update
+from phone_query import build_query
+from read_config import as_bool, get_async_database_uri, get_engine_options, get_setting
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, PhoneSearch, tokenize
+from serializer import dumps_bytes, phone_etag, row_to_dict, select_phones
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+STREAM_BATCH_SIZE = 500
+MAX_PAGE_LIMIT = 1000
+CONVERSIONS = {
+    'number_of_cameras': int,
+    'number_of_cores': int,
+    'weight': int,
+    'battery_capacity': int,
+    'cost': float,
+    'id': int,
+    'version': int,
+}
+
+def resolve_database_uri(uri):
+    # Flask-SQLAlchemy puts relative SQLite paths in the instance folder; match it
+    # so both entry points open the same file.
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' \
+            and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'').decode('latin-1')
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope.get('headers', [])}
+        self.body = body
+
+    @property
+    def full_path(self):
+        return f"{self.path}?{self.query_string}"
+
+    def json(self):
+        return json.loads(self.body or b'null')
+
+class Response:
+    def __init__(self, body=None, status=200, headers=None, stream=None):
+        # body is encoded as JSON unless it is already bytes/str; stream is an async iterator of bytes.
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = dumps_bytes(body)
+        self.body = body.encode() if isinstance(body, str) else (body or b'')
+        self.status = status
+        self.headers = dict(headers or {})
+        self.stream = stream
+        self.content_type = 'application/json'
+
+    async def send(self, send):
+        headers = [(b'content-type', self.content_type.encode())]
+        headers += [(name.lower().encode(), str(value).encode()) for name, value in self.headers.items()]
+        if self.stream is None:
+            headers.append((b'content-length', str(len(self.body)).encode()))
+            await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        async for chunk in self.stream:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+def error(message, status=400):
+    return Response({"error": message}, status)
+
+# If-Match check for writes to one phone, as in MainInterface.precondition_failed.
+def precondition_failed(request, phone):
+    if_match = parse_etags(request.headers.get('if-match'))
+    if not if_match or if_match.contains(phone_etag(phone)):
+        return None
+    return Response({"error": "The phone has changed; fetch it again and retry with its new ETag."}, 412,
+                    headers={'ETag': f'"{phone_etag(phone)}"'})
+
+def conflict():
+    # The row version moved between our read and our write (see MobilePhone.version).
+    return error("The phone was changed by another request; fetch it again and retry.", 409)
+
+class PhoneAPI:
+    """Minimal ASGI application mirroring the routes of MainInterface.py."""
+
+    def __init__(self, database_uri=None, create_schema=None):
+        url = resolve_database_uri(database_uri or get_async_database_uri())
+        self.engine = create_async_engine(url, **get_engine_options(url.render_as_string(hide_password=False)))
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        # Defaults to [database] auto_create_schema, like MainInterface.create_app().
+        if create_schema is None:
+            create_schema = get_setting('database', 'auto_create_schema', default=False, cast=as_bool)
+        self.create_schema = create_schema
+        # No phones_changed signal here; the trie backend follows the catalogue version instead.
+        self.search = PhoneSearch(get_setting('search', 'backend', default='auto'),
+                                  get_setting('search', 'trie_rebuild_interval', default=300, cast=int))
+        # The [idempotency] store of MainInterface.create_app, with the same keys; with
+        # backend = shared a retry replays whichever entry point ran the first attempt.
+        self.idempotency_store = create_cache(
+            backend=get_setting('idempotency', 'backend', default='lru'),
+            maxsize=get_setting('idempotency', 'maxsize', default=10000, cast=int),
+            ttl=get_setting('idempotency', 'ttl', default=86400, cast=int),
+            prefix='phone-api-idempotency:',
+        )
+        self.idempotency_lease = get_setting('idempotency', 'lease', default=60, cast=int)
+        self.routes = []
+        self.route('GET', r'/', self.index)
+        self.route('POST', r'/add_phone', self.add_phone, idempotent=True)
+        self.route('GET', r'/phones', self.get_phones, conditional=True)
+        self.route('GET', r'/phone/', self.get_phones, conditional=True)
+        self.route('GET', r'/phones/query', self.query_phones, conditional=True)
+        self.route('GET', r'/phones/stats', self.get_phone_stats, conditional=True)
+        self.route('GET', r'/phones/search', self.search_phones, conditional=True)
+        self.route('PUT', r'/update_phone/(?P<serial_number>[^/]+)', self.update_phone, idempotent=True)
+        self.route('DELETE', r'/delete_phone/(?P<serial_number>[^/]+)', self.delete_phone, idempotent=True)
+        self.route('GET', r'/phone/(?P<serial_number>[^/]+)', self.get_phone)
+        self.route('GET', r'/phones/(?P<field>[^/]+)/(?P<value>[^/]+)', self.get_phones_by_field,
+                   conditional=True)
+
+    def route(self, method, pattern, handler, conditional=False, idempotent=False):
+        self.routes.append((method, re.compile(pattern + '$'), handler, conditional, idempotent))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        request = Request(scope, body)
+        response = await self.dispatch(request)
+        await response.send(send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        if self.create_schema:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(db.metadata.create_all)
+
+    async def shutdown(self):
+        await self.engine.dispose()
+
+    async def dispatch(self, request):
+        path_matched = False
+        for method, pattern, handler, conditional, idempotent in self.routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            path_matched = True
+            if method != request.method:
+                continue
+            if conditional:
+                return await self.conditional(request, handler, match.groupdict())
+            if idempotent and 'idempotency-key' in request.headers:
+                return await self.idempotent(request, handler, match.groupdict())
+            async with self.sessions() as session:
+                return await handler(request, session, **match.groupdict())
+        return error("Method not allowed", 405) if path_matched else error("Not found", 404)
+
+    async def conditional(self, request, handler, params):
+        # Same ETag scheme as MainInterface.conditional_on_catalogue.
+        session = self.sessions()
+        version = await session.scalar(catalogue_version_query()) or 0
+        digest = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+        etag = f"{version}-{digest}"
+        if parse_etags(request.headers.get('if-none-match')).contains(etag):
+            await session.close()
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        try:
+            response = await handler(request, session, **params)
+        except Exception:
+            await session.close()
+            raise
+        if response.stream is None:
+            await session.close()
+        else:
+            response.stream = self._closing(response.stream, session)
+        if response.status == 200:
+            response.headers['ETag'] = f'"{etag}"'
+        return response
+
+    async def idempotent(self, request, handler, params):
+        # Same handling as MainInterface's idempotent decorator (see idempotency.py).
+        store = self.idempotency_store
+        fingerprint = request_fingerprint(request.query_string.encode('latin-1'), request.body)
+        try:
+            key = store_key(request.method, request.path, request.headers['idempotency-key'])
+            entry = claim(store, key, fingerprint, self.idempotency_lease)
+        except IdempotencyError as e:
+            return error(str(e), e.status)
+        if entry is not None:
+            response = Response(entry['body'], entry['status'], headers=entry['headers'])
+            response.content_type = response.headers.pop('Content-Type', response.content_type)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            async with self.sessions() as session:
+                response = await handler(request, session, **params)
+        except Exception:
+            store.delete(key)
+            raise
+        headers = dict(response.headers, **{'Content-Type': response.content_type})
+        finish(store, key, fingerprint, response.status, headers, response.body.decode(), response.stream is not None)
+        return response
+
+    @staticmethod
+    async def _closing(stream, session):
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await session.close()
+
+    async def index(self, request, session):
+        response = Response("Welcome to the Phone API!")
+        response.content_type = 'text/html; charset=utf-8'
+        return response
+
+    async def add_phone(self, request, session):
+        try:
+            data = request.json()
+            phone = MobilePhone(**{field: data[field] for field in PUBLIC_FIELDS if field not in ('id', 'version')})
+            await bump_catalogue_version(session)
+            session.add(phone)
+            # The aggregate helpers are synchronous; run_sync hands them the underlying Session.
+            await session.run_sync(apply_aggregate_changes, (), [phone.to_dict()])
+            await session.commit()
+            return Response(phone.to_dict(), 201, headers={'ETag': f'"{phone_etag(phone.to_dict())}"'})
+        except KeyError as e:
+            await session.rollback()
+            return error(f"Missing required field: {str(e)}")
+        except IntegrityError:
+            await session.rollback()
+            return error("A phone with this serial number or IMEI already exists.")
+        except (ValueError, TypeError) as e:
+            await session.rollback()
+            return error(str(e))
+
+    async def get_phones(self, request, session):
+        try:
+            limit = int_arg(request.args.get('limit'))
+            after = int_arg(request.args.get('after')) or 0
+        except ValueError as e:
+            return error(str(e))
+
+        statement = select_phones().where(MobilePhone.id > after).order_by(MobilePhone.id)
+        if limit is None:
+            return Response(stream=self._stream_rows(session, statement))
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            return error(f"limit must be between 1 and {MAX_PAGE_LIMIT}.")
+        phones = (await session.execute(statement.limit(limit))).all()
+        headers = {'X-Next-After': phones[-1].id} if len(phones) == limit else {}
+        return Response([row_to_dict(phone) for phone in phones], headers=headers)
+
+    @staticmethod
+    async def _stream_rows(session, statement):
+        # Server-side cursor: one batch of rows in memory at a time.
+        result = await session.stream(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        first = True
+        yield b"["
+        async for partition in result.partitions():
+            chunk = b",".join(dumps_bytes(row_to_dict(row)) for row in partition)
+            yield (b"" if first else b",") + chunk
+            first = False
+        yield b"]"
+
+    async def query_phones(self, request, session):
+        try:
+            statement, fields = build_query(request.args)
+        except ValueError as e:
+            return error(str(e))
+        rows = await session.execute(statement)
+        return Response([row_to_dict(row, fields) for row in rows])
+
+    async def get_phone_stats(self, request, session):
+        dimensions = request.args.getlist('dimension') or AGGREGATE_DIMENSIONS
+        for dimension in dimensions:
+            if dimension not in AGGREGATE_DIMENSIONS:
+                return error(f"dimension must be among: {', '.join(AGGREGATE_DIMENSIONS)}.")
+        return Response(await session.run_sync(catalogue_stats, dimensions))
+
+    async def search_phones(self, request, session):
+        query = request.args.get('q', '')
+        try:
+            limit = int_arg(request.args.get('limit', str(DEFAULT_SEARCH_LIMIT)))
+        except ValueError as e:
+            return error(str(e))
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            return error(f"limit must be between 1 and {MAX_SEARCH_LIMIT}.")
+        if not tokenize(query):
+            return error("q must contain at least one letter or digit.")
+        return Response(await session.run_sync(self.search.search, query, limit))
+
+    async def get_phone(self, request, session, serial_number):
+        phone = (await session.execute(
+            select_phones().where(MobilePhone.serial_number == serial_number))).first()
+        if phone is None:
+            return error("Phone not found", 404)
+        # Row-version ETag, as in MainInterface.get_phone.
+        etag = phone_etag(row_to_dict(phone))
+        if parse_etags(request.headers.get('if-none-match')).contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        return Response(row_to_dict(phone), headers={'ETag': f'"{etag}"'})
+
+    async def get_phones_by_field(self, request, session, field, value):
+        if field not in PUBLIC_FIELDS:
+            return error("Invalid field")
+        try:
+            converted_value = CONVERSIONS.get(field, str)(value)
+        except ValueError:
+            return error(f"Invalid type for field {field}. Expected appropriate type.")
+
+        if field == 'network_technologies':
+            if value not in ALLOWED_NETWORKS:
+                return error(f"Network technologies must be among: {', '.join(ALLOWED_NETWORKS)}.")
+            condition = MobilePhone.network_mask.in_(masks_including(value))
+        else:
+            condition = getattr(MobilePhone, field) == converted_value
+        rows = await session.execute(select_phones().where(condition)
+                                     .order_by(MobilePhone.brand, MobilePhone.model, MobilePhone.cost))
+        return Response([row_to_dict(row) for row in rows])
+
+    async def update_phone(self, request, session, serial_number):
+        phone = await session.scalar(select(MobilePhone).where(MobilePhone.serial_number == serial_number))
+        if phone is None:
+            return error("Phone not found", 404)
+        try:
+            values = validate_update(request.json())
+        except ValidationError as e:
+            return Response({"error": str(e), "errors": e.errors}, 400)
+        before = phone.to_dict()
+        failed = precondition_failed(request, before)
+        if failed is not None:
+            return failed
+        try:
+            await bump_catalogue_version(session)
+            for field, value in values.items():
+                setattr(phone, field, value)
+            await session.run_sync(apply_aggregate_changes, [before], [phone.to_dict()])
+            await session.commit()
+            return Response(phone.to_dict(), headers={'ETag': f'"{phone_etag(phone.to_dict())}"'})
+        except StaleDataError:
+            await session.rollback()
+            return conflict()
+        except (ValueError, TypeError) as e:
+            await session.rollback()
+            return error(str(e))
+
+    async def delete_phone(self, request, session, serial_number):
+        # Before the row lock; see bump_catalogue_version for the lock order.
+        await bump_catalogue_version(session)
+        phone = (await session.execute(select_phones().with_for_update()
+                                       .where(MobilePhone.serial_number == serial_number))).first()
+        if phone is None:
+            await session.rollback()
+            return error("Phone not found", 404)
+        before = row_to_dict(phone)
+        failed = precondition_failed(request, before)
+        if failed is not None:
+            await session.rollback()
+            return failed
+        # Core DELETE, so the row version is checked here rather than by the ORM.
+        result = await session.execute(delete(MobilePhone).where(
+            MobilePhone.serial_number == serial_number, MobilePhone.version == before['version']))
+        if result.rowcount != 1:
+            await session.rollback()
+            return conflict()
+        await record_deletions(session, [before['id']])
+        await session.run_sync(apply_aggregate_changes, [before])
+        await session.commit()
+        return Response({"message": "Phone deleted successfully"})
+
+def int_arg(value):
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"Expected a non-negative integer, got '{value}'.")
+    return int(value)
+
+app = PhoneAPI()
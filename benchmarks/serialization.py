@@ -0,0 +1,86 @@
+"""Compare list-endpoint serialization before and after the serializer layer.
+
+Seeds an in-memory SQLite catalogue and measures rows/second for:
+  before: ORM objects + MobilePhone.to_dict() + the stdlib JSON provider
+  after:  column tuples + serializer.row_to_dict() + the configured fast provider
+
+Usage: python benchmarks/serialization.py [--rows 50000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert
+
+from dbmanager import db, MobilePhone, network_mask
+from serializer import get_json_provider_class, row_to_dict, select_phones
+
+NETWORKS = [["GSM", "LTE"], ["LTE", "5G"], ["GSM", "HSPA", "3G"], ["4G", "5G"], ["5G"]]
+
+def seed(rows):
+    values = []
+    for i in range(rows):
+        networks = NETWORKS[i % len(NETWORKS)]
+        values.append({
+            "serial_number": f"B{i:010d}",
+            "imei": f"{i:015d}",
+            "model": f"M{i % 500}",
+            "brand": ["Nokia", "Samsung", "Apple", "Xiaomi"][i % 4],
+            "network_technologies": ",".join(networks),
+            "network_mask": network_mask(networks),
+            "number_of_cameras": 1 + i % 3,
+            "number_of_cores": 2 + i % 7,
+            "weight": 120 + i % 100,
+            "battery_capacity": 2500 + i % 2500,
+            "cost": 99.0 + i % 900,
+        })
+    db.session.execute(insert(MobilePhone), values)
+    db.session.commit()
+
+def before(app):
+    phones = MobilePhone.query.all()
+    return app.json.dumps([phone.to_dict() for phone in phones])
+
+def after(app):
+    rows = db.session.execute(select_phones())
+    return app.json.dumps([row_to_dict(row) for row in rows])
+
+def measure(app, provider_class, fn, rows, repeat):
+    app.json = provider_class(app)
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn(app)
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--provider', default='auto', help="JSON provider for the 'after' run")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+        slow = measure(app, DefaultJSONProvider, before, args.rows, args.repeat)
+        fast_provider = get_json_provider_class(args.provider)
+        fast = measure(app, fast_provider, after, args.rows, args.repeat)
+
+    print(f"rows: {args.rows}")
+    print(f"before (ORM + to_dict + {DefaultJSONProvider.__name__}): {slow:,.0f} rows/s")
+    print(f"after  (tuples + row_to_dict + {fast_provider.__name__}): {fast:,.0f} rows/s")
+    print(f"speedup: {fast / slow:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Report the memory footprint and read latency of the catalogue snapshot by row count.
+
+For each --rows value, seeds a temporary database with the synthetic phones of
+load.py, loads a snapshot.CatalogueSnapshot from it and prints:
+  load      seconds for the full load
+  snapshot  bytes per phone as counted by CatalogueSnapshot.memory()
+  dicts     bytes per phone of the same rows held as a list of to_dict()-style
+            dicts, measured with tracemalloc, for comparison
+  get/page/filter/range  mean microseconds of a serial lookup, a 100-phone
+            page, a model filter and a cost range query with a limit
+The per-column breakdown of the largest run is printed at the end.
+
+Usage:
+  python benchmarks/snapshot_memory.py [--rows 10000,100000,1000000] [--lookups 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load import MODELS, seed
+from dbmanager import db, MobilePhone
+from serializer import row_to_dict, select_phones
+from snapshot import CatalogueSnapshot
+
+def dict_bytes(session):
+    tracemalloc.start()
+    phones = [row_to_dict(row) for row in session.execute(select_phones().order_by(MobilePhone.id))]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(phones)
+
+def mean_us(function, lookups):
+    start = time.perf_counter()
+    for _ in range(lookups):
+        function()
+    return (time.perf_counter() - start) / lookups * 1e6
+
+def measure(rows, lookups, tmpdir):
+    from MainInterface import create_app
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmpdir, f'snapshot-{rows}.db')}"})
+    seed(app, rows)
+    with app.app_context():
+        snapshot = CatalogueSnapshot()
+        start = time.perf_counter()
+        snapshot.current(db.session)
+        load = time.perf_counter() - start
+        memory = snapshot.memory()
+        result = {
+            "rows": rows,
+            "load_s": round(load, 2),
+            "snapshot_bytes": memory['bytes_per_phone'],
+            "dict_bytes": round(dict_bytes(db.session), 1),
+            "get_us": mean_us(lambda: snapshot.phone(f"L{random.randrange(rows):010d}"), lookups),
+            "page_us": mean_us(lambda: snapshot.page(random.randrange(rows), 100), lookups // 10),
+            "filter_us": mean_us(lambda: snapshot.select([('model', 'eq', f"M{random.randrange(MODELS)}")]),
+                                 lookups // 100 or 1),
+            "range_us": mean_us(lambda: snapshot.select([('cost', 'lt', 99.0 + random.randrange(900))], limit=20),
+                                lookups // 100 or 1),
+        }
+        db.engine.dispose()
+    return result, memory
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10000,100000', help="comma-separated catalogue sizes")
+    parser.add_argument('--lookups', type=int, default=2000, help="serial lookups timed per size")
+    args = parser.parse_args()
+    random.seed(0)
+    os.environ['CACHE_BACKEND'] = 'none'
+
+    print(f"{'rows':>9} {'load s':>7} {'snapshot B/row':>15} {'dicts B/row':>12} "
+          f"{'get us':>8} {'page us':>8} {'filter us':>10} {'range us':>9}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rows in (int(value) for value in args.rows.split(',')):
+            result, memory = measure(rows, args.lookups, tmpdir)
+            print(f"{result['rows']:>9} {result['load_s']:>7} {result['snapshot_bytes']:>15} "
+                  f"{result['dict_bytes']:>12} {result['get_us']:>8.1f} {result['page_us']:>8.1f} "
+                  f"{result['filter_us']:>10.1f} {result['range_us']:>9.1f}")
+    print(f"\nBytes per column at {memory['phones']} phones:")
+    for column, size in sorted(memory['bytes'].items(), key=lambda item: -item[1]):
+        print(f"  {column:<15} {size:>12} ({size / memory['phones']:.1f}/phone)")
+
+if __name__ == '__main__':
+    main()
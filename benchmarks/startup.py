@@ -0,0 +1,63 @@
+"""Measure worker startup: time from a fresh interpreter to the first served request.
+
+Each run starts a new Python process that imports MainInterface, builds the
+app and serves GET /phones?limit=1 through the test client, i.e. what a new
+gunicorn worker does before it can answer its readiness probe. Two modes are
+compared against the same, already initialised database:
+  before: schema created/inspected at startup (auto_create_schema = true)
+  after:  schema left to `flask --app MainInterface init-db`
+
+Usage: python benchmarks/startup.py [--runs 10] [--database-uri mysql+pymysql://...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process; prints seconds from interpreter start to the first response.
+CHILD = """
+import time
+start = time.perf_counter()
+from MainInterface import app
+response = app.test_client().get('/phones?limit=1')
+assert response.status_code == 200, response.status_code
+print(time.perf_counter() - start)
+"""
+
+def run(env, runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+def report(label, timings):
+    print(f"{label}: median {statistics.median(timings) * 1000:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms over {len(timings)} runs")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-uri', help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir, 'startup.db')}"
+        env = dict(os.environ, DATABASE_URI=database_uri)
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'MainInterface', 'init-db'],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+
+        before = run(dict(env, DATABASE_AUTO_CREATE_SCHEMA='true'), args.runs)
+        after = run(dict(env, DATABASE_AUTO_CREATE_SCHEMA='false'), args.runs)
+
+    report("before (create_all at startup)", before)
+    report("after  (schema left to init-db)", after)
+    print(f"speedup: {statistics.median(before) / statistics.median(after):.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from bulk_update import STATEMENT_BATCH_SIZE
+from dbmanager import db, MobilePhone, apply_aggregate_changes, bump_catalogue_version, network_mask
+from phoneValidator import PHONE_VALIDATOR
+from signals import phones_changed
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+def parse_records(body, content_type):
+    # Accept either a JSON array or newline-delimited JSON (one phone per line).
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if content_type and content_type.split(';')[0].strip() in NDJSON_CONTENT_TYPES:
+        records = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(current_app.json.loads(line))
+            except ValueError:
+                raise ValueError(f"Line {line_number} is not valid JSON.")
+        return records
+
+    try:
+        records = current_app.json.loads(text)
+    except ValueError:
+        raise ValueError("Request body is not valid JSON.")
+    if not isinstance(records, list):
+        raise ValueError("Request body must be a JSON array of phone records.")
+    return records
+
+def find_duplicates(rows):
+    # rows: list of (index, values). Returns {index: [messages]} for rows whose
+    # serial number or IMEI repeats within the batch or already exists in the DB.
+    duplicates = {}
+    seen = {'serial_number': {}, 'imei': {}}
+    for index, values in rows:
+        for field, label in (('serial_number', 'serial number'), ('imei', 'IMEI')):
+            first = seen[field].setdefault(values[field], index)
+            if first != index:
+                duplicates.setdefault(index, []).append(
+                    f"Duplicate {label} within batch (first seen at index {first}).")
+
+    if rows:
+        existing_serials = _existing(MobilePhone.serial_number, list(seen['serial_number']))
+        existing_imeis = _existing(MobilePhone.imei, list(seen['imei']))
+        for index, values in rows:
+            if values['serial_number'] in existing_serials:
+                duplicates.setdefault(index, []).append("A phone with this serial number already exists.")
+            if values['imei'] in existing_imeis:
+                duplicates.setdefault(index, []).append("A phone with this IMEI already exists.")
+    return duplicates
+
+def _existing(column, values):
+    # One IN (...) per STATEMENT_BATCH_SIZE values, so large batches stay under the bound-parameter limit.
+    existing = set()
+    for chunk in _chunks(values, STATEMENT_BATCH_SIZE):
+        existing.update(db.session.scalars(select(column).where(column.in_(chunk))))
+    return existing
+
+def _chunks(rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+def _insert(rows):
+    bump_catalogue_version(db.session)
+    # A list of parameter dicts makes SQLAlchemy issue a single executemany INSERT.
+    db.session.execute(insert(MobilePhone), [values for _, values in rows])
+    apply_aggregate_changes(db.session, after=[values for _, values in rows])
+
+def _committed(rows):
+    phones_changed.send(current_app._get_current_object(), before=[], after=[values for _, values in rows])
+
+def ingest_phones(records, chunk_size=1000, atomic=True, written=None):
+    """Validate and insert a batch of phone records.
+
+    With atomic=True nothing is written unless every record is valid, and all
+    chunks share one transaction. Otherwise valid records are committed one
+    chunk per transaction and the rest are reported back. If given, written
+    collects the indexes of records as their transaction commits, so a caller
+    can tell which were stored when a later chunk raises.
+    """
+    if written is None:
+        written = []
+    errors = {}
+    rows = []
+    for index, (values, record_errors) in enumerate(PHONE_VALIDATOR.check_many(records)):
+        if record_errors:
+            errors[index] = list(record_errors.values())
+        else:
+            # Core INSERTs bypass the model, so derive the indexed mask here.
+            values['network_mask'] = network_mask(values['network_technologies'])
+            rows.append((index, values))
+
+    for index, messages in find_duplicates(rows).items():
+        errors.setdefault(index, []).extend(messages)
+    rows = [(index, values) for index, values in rows if index not in errors]
+
+    inserted = []
+    if atomic and errors:
+        rows = []
+    elif atomic:
+        try:
+            for chunk in _chunks(rows, chunk_size):
+                _insert(chunk)
+            db.session.commit()
+            inserted = rows
+            written.extend(index for index, _ in rows)
+            _committed(rows)
+        except IntegrityError:
+            db.session.rollback()
+            for index, _ in rows:
+                errors[index] = ["Batch rejected: a conflicting phone was added concurrently."]
+    else:
+        for chunk in _chunks(rows, chunk_size):
+            try:
+                _insert(chunk)
+                db.session.commit()
+                inserted.extend(chunk)
+                written.extend(index for index, _ in chunk)
+                _committed(chunk)
+            except IntegrityError:
+                # Another writer raced us; retry row by row to find the offenders.
+                db.session.rollback()
+                for row in chunk:
+                    try:
+                        _insert([row])
+                        db.session.commit()
+                        inserted.append(row)
+                        written.append(row[0])
+                        _committed([row])
+                    except IntegrityError:
+                        db.session.rollback()
+                        errors[row[0]] = ["A phone with this serial number or IMEI already exists."]
+
+    return {
+        "received": len(records),
+        "inserted": len(inserted),
+        "rejected": len(errors),
+        "errors": [{"index": index, "errors": errors[index]} for index in sorted(errors)],
+    }
@@ -0,0 +1,134 @@
+from flask import current_app
+from sqlalchemy import delete, update
+from werkzeug.datastructures import MultiDict
+
+from dbmanager import (
+    db, MobilePhone, apply_aggregate_changes, bump_catalogue_version, network_mask, record_deletions,
+    split_technologies,
+)
+from phoneValidator import validate_update
+from phone_query import RESERVED_PARAMS, parse_filters
+from serializer import row_to_dict, select_phones
+from signals import phones_changed
+
+# Serial numbers per UPDATE/DELETE statement, well under SQLite's bound-parameter limit.
+STATEMENT_BATCH_SIZE = 1000
+
+def parse_targets(data):
+    """Read the phones a bulk request applies to.
+
+    The body names them either by "serial_numbers" (a list) or by "filter", an
+    object using the /phones/query syntax, e.g. {"brand": "Nokia", "cost__lt": 500}.
+    Returns (serial_numbers, conditions); exactly one of them is None.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object.")
+    if ('serial_numbers' in data) == ('filter' in data):
+        raise ValueError("Provide either 'serial_numbers' or 'filter'.")
+
+    if 'serial_numbers' in data:
+        serial_numbers = data['serial_numbers']
+        if not isinstance(serial_numbers, list) or not serial_numbers \
+                or not all(isinstance(serial, str) for serial in serial_numbers):
+            raise ValueError("'serial_numbers' must be a non-empty list of strings.")
+        # Keep the first occurrence of each serial so the report follows the request order.
+        return list(dict.fromkeys(serial_numbers)), None
+
+    criteria = data['filter']
+    if not isinstance(criteria, dict) or not criteria:
+        raise ValueError("'filter' must be a non-empty object.")
+    args = MultiDict()
+    for key, value in criteria.items():
+        if key in RESERVED_PARAMS:
+            raise ValueError(f"'{key}' is not a filter.")
+        if isinstance(value, list):
+            if key == 'network_technologies':
+                # A list of technologies means "has any of", the mask-based __in filter.
+                key = 'network_technologies__in'
+            value = ','.join(str(item) for item in value)
+        args.add(key, str(value))
+    return None, parse_filters(args)
+
+def _select_targets(serial_numbers, conditions):
+    # Row locks (FOR UPDATE on MySQL) keep the report consistent with what the
+    # UPDATE/DELETE statements change.
+    statement = select_phones().with_for_update().order_by(MobilePhone.id)
+    if serial_numbers is None:
+        return [row_to_dict(row) for row in db.session.execute(statement.where(*conditions))]
+    phones = []
+    for start in range(0, len(serial_numbers), STATEMENT_BATCH_SIZE):
+        chunk = serial_numbers[start:start + STATEMENT_BATCH_SIZE]
+        phones.extend(row_to_dict(row) for row in
+                      db.session.execute(statement.where(MobilePhone.serial_number.in_(chunk))))
+    return phones
+
+def _execute(statement, serial_numbers):
+    for start in range(0, len(serial_numbers), STATEMENT_BATCH_SIZE):
+        chunk = serial_numbers[start:start + STATEMENT_BATCH_SIZE]
+        db.session.execute(statement.where(MobilePhone.serial_number.in_(chunk))
+                           .execution_options(synchronize_session=False))
+
+def _report(requested, found, status):
+    found_serials = {phone['serial_number'] for phone in found}
+    if requested is None:
+        requested = [phone['serial_number'] for phone in found]
+    results = [{"serial_number": serial, "status": status if serial in found_serials else "not_found"}
+               for serial in requested]
+    return {
+        status: len(found_serials),
+        "not_found": len(results) - len(found_serials),
+        "results": results,
+    }
+
+def update_phones(data):
+    """Apply one patch to many phones with set-based UPDATE statements.
+
+    The patch follows the same rules as PUT /update_phone/<serial>: immutable
+    fields are rejected and values are validated once for the whole batch.
+    """
+    serial_numbers, conditions = parse_targets(data)
+    values = validate_update(data.get('patch'))
+    if not values:
+        raise ValueError("'patch' must change at least one field.")
+    if 'network_technologies' in values:
+        # Core UPDATEs bypass the model, so derive the indexed mask here.
+        values['network_mask'] = network_mask(values['network_technologies'])
+
+    # Before the row locks of _select_targets; see bump_catalogue_version for the lock order.
+    bump_catalogue_version(db.session)
+    before = _select_targets(serial_numbers, conditions)
+    # The new rows in the same form as the old ones, for the aggregates and listeners.
+    changes = {field: value for field, value in values.items() if field != 'network_mask'}
+    if 'network_technologies' in changes:
+        changes['network_technologies'] = list(split_technologies(changes['network_technologies']))
+    after = [dict(phone, **changes, version=phone['version'] + 1) for phone in before]
+    found = [phone['serial_number'] for phone in before]
+    if found:
+        # Bumping the version makes If-Match updates based on the old rows fail.
+        _execute(update(MobilePhone).values(**values, version=MobilePhone.version + 1), found)
+        apply_aggregate_changes(db.session, before=before, after=after)
+        db.session.commit()
+    else:
+        db.session.rollback()  # nothing changed, so keep the catalogue version
+
+    if before:
+        phones_changed.send(current_app._get_current_object(), before=before, after=after)
+    return _report(serial_numbers, before, "updated")
+
+def delete_phones(data):
+    """Delete many phones with set-based DELETE statements."""
+    serial_numbers, conditions = parse_targets(data)
+    bump_catalogue_version(db.session)
+    before = _select_targets(serial_numbers, conditions)
+    found = [phone['serial_number'] for phone in before]
+    if found:
+        _execute(delete(MobilePhone), found)
+        record_deletions(db.session, [phone['id'] for phone in before])
+        apply_aggregate_changes(db.session, before=before)
+        db.session.commit()
+    else:
+        db.session.rollback()
+
+    if before:
+        phones_changed.send(current_app._get_current_object(), before=before, after=[])
+    return _report(serial_numbers, before, "deleted")
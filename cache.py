@@ -0,0 +1,248 @@
+import threading
+import time
+from collections import OrderedDict
+
+class CacheBackend:
+    """Interface shared by the response caches.
+
+    Values are serialized response bodies; get() returns None on a miss.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store value; ttl overrides the backend's default lifetime in seconds."""
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it holds no live value; returns whether it was set."""
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    # Catalogue-wide entries (the /phones/<field>/<value> bodies) are stored
+    # with the catalogue version they were read at. Invalidation only reaches
+    # the worker that made the write, so an entry older than the version the
+    # request has already read is treated as a miss.
+    def set_versioned(self, key, version, body):
+        if isinstance(body, bytes):
+            body = body.decode()
+        self.set(key, f"{version}:{body}")
+
+    def get_versioned(self, key, version):
+        entry = self.get(key)
+        if entry is None:
+            return None
+        if isinstance(entry, bytes):
+            entry = entry.decode()
+        stored, _, body = entry.partition(':')
+        if int(stored) < version:
+            self.stale += 1
+            return None
+        return body
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self):
+        return {"backend": type(self).__name__, "hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+class NullCache(CacheBackend):
+    # Used when caching is disabled; every lookup is a miss.
+    def get(self, key):
+        return self._count(None)
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def add(self, key, value, ttl=None):
+        return True
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+class LRUCache(CacheBackend):
+    """In-process cache holding at most maxsize entries, each for at most ttl seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self._count(None)
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return self._count(None)
+            self._entries.move_to_end(key)
+            return self._count(value)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl=None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(size=len(self._entries), maxsize=self.maxsize, ttl=self.ttl, evictions=self.evictions)
+        return stats
+
+class LocalSharedStore:
+    """In-process stand-in for a shared key-value server.
+
+    Implements the subset of the redis-py client API SharedCache uses, so a
+    real redis.Redis client can be passed to SharedCache instead.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if nx and name in self._data:
+                expires_at = self._data[name][0]
+                if expires_at is None or expires_at >= time.monotonic():
+                    return None
+            self._data[name] = (time.monotonic() + ex if ex else None, value)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            for name in names:
+                self._data.pop(name, None)
+
+    def scan_iter(self, match=None):
+        prefix = match.rstrip('*') if match else ''
+        with self._lock:
+            names = [name for name in self._data if name.startswith(prefix)]
+        return iter(names)
+
+class SharedCache(CacheBackend):
+    """Cache kept in a key-value server shared by all workers (see LocalSharedStore)."""
+
+    def __init__(self, client, ttl=60, prefix='phone-api:'):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        return self._count(self.client.get(self.prefix + key))
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl)
+
+    def add(self, key, value, ttl=None):
+        # SET NX is atomic on the server, so only one worker wins.
+        return bool(self.client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl, nx=True))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        names = list(self.client.scan_iter(match=self.prefix + '*'))
+        if names:
+            self.client.delete(*names)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(ttl=self.ttl)
+        return stats
+
+def create_cache(backend='lru', maxsize=1024, ttl=60, client=None, prefix='phone-api:'):
+    if backend == 'lru':
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if backend == 'shared':
+        return SharedCache(client or LocalSharedStore(), ttl=ttl, prefix=prefix)
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f"Unknown cache backend '{backend}'. Expected 'lru', 'shared' or 'none'.")
+
+# Filters on id and version are not cached: ids of bulk-inserted rows are not known
+# up front and versions change on every update, so those entries could not be
+# invalidated precisely.
+CACHEABLE_FILTERS = {
+    'serial_number', 'imei', 'model', 'brand', 'network_technologies', 'number_of_cameras',
+    'number_of_cores', 'weight', 'battery_capacity', 'cost',
+}
+
+# Cache keys. A filter key stores the converted value so equivalent URLs
+# (e.g. /phones/cost/300 and /phones/cost/300.0) share one entry.
+def phone_key(serial_number):
+    return f"phone:{serial_number}"
+
+def filter_key(field, value):
+    return f"filter:{field}={value}"
+
+def keys_for_phone(phone):
+    """Every key whose cached response could include this phone (a to_dict()-shaped dict)."""
+    keys = [phone_key(phone['serial_number'])]
+    for field, value in phone.items():
+        if field not in CACHEABLE_FILTERS:
+            continue
+        if field == 'network_technologies':
+            technologies = value.split(",") if isinstance(value, str) else value
+            keys.extend(filter_key(field, tech) for tech in technologies)
+        else:
+            keys.append(filter_key(field, value))
+    return keys
@@ -1,21 +1,61 @@
+import time
+from functools import lru_cache
+
 from flask_sqlalchemy import SQLAlchemy
-from phoneValidator import (
-    validate_serial_number,
-    validate_imei,
-    validate_model,
-    validate_brand,
-    validate_network_technologies,
-    validate_number_of_cameras,
-    validate_number_of_cores,
-    validate_weight,
-    validate_battery_capacity,
-    validate_cost,
+from sqlalchemy import (
+    DDL, bindparam, column, delete, event, func, insert, inspect, select, table as sql_table, text, tuple_, update,
 )
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import validates
+from replica import RoutingSession
+from phoneValidator import NETWORK_TECHNOLOGIES, PHONE_VALIDATOR
+
+# RoutingSession sends read-only requests to a replica when one is configured (see replica.py).
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+@lru_cache(maxsize=1024)
+def split_technologies(value):
+    # The catalogue only has a few dozen distinct combinations, so each
+    # stored string is split once per process instead of once per row.
+    return tuple(value.split(","))
+
+# One bit per technology, e.g. ["GSM", "LTE"] -> 0b101.
+NETWORK_BITS = {tech: 1 << i for i, tech in enumerate(NETWORK_TECHNOLOGIES)}
 
-db = SQLAlchemy()
+def network_mask(network_technologies):
+    # Accepts the list clients send or the comma-joined string stored in the table.
+    if isinstance(network_technologies, str):
+        network_technologies = network_technologies.split(",")
+    mask = 0
+    for tech in network_technologies:
+        mask |= NETWORK_BITS[tech]
+    return mask
+
+def masks_including(tech):
+    # Every mask value containing the technology's bit. Filtering with
+    # network_mask IN (...) lets the database answer from the index.
+    bit = NETWORK_BITS[tech]
+    return [mask for mask in range(1 << len(NETWORK_BITS)) if mask & bit]
+
+# The catalogue version as seen inside the current transaction. Writers bump it
+# before writing, so rows stamped with it carry the version they commit as.
+CURRENT_CATALOGUE_VERSION = text("(SELECT version FROM catalogue_state WHERE id = 1)")
 
 class MobilePhone(db.Model):
     __tablename__ = 'mobile_phones'
+    # /phones/<field>/<value> filters on one column and orders by (brand, model, cost).
+    # Each filterable column leads an index that continues with the sort columns,
+    # so both the filter and the ORDER BY are answered from the index.
+    __table_args__ = (
+        db.Index('ix_mobile_phones_brand_model_cost', 'brand', 'model', 'cost'),
+        db.Index('ix_mobile_phones_model_sort', 'model', 'brand', 'cost'),
+        db.Index('ix_mobile_phones_number_of_cameras_sort', 'number_of_cameras', 'brand', 'model', 'cost'),
+        db.Index('ix_mobile_phones_number_of_cores_sort', 'number_of_cores', 'brand', 'model', 'cost'),
+        db.Index('ix_mobile_phones_weight_sort', 'weight', 'brand', 'model', 'cost'),
+        db.Index('ix_mobile_phones_battery_capacity_sort', 'battery_capacity', 'brand', 'model', 'cost'),
+        db.Index('ix_mobile_phones_cost_sort', 'cost', 'brand', 'model'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     serial_number = db.Column(db.String(11), unique=True, nullable=False)
@@ -23,26 +63,47 @@ class MobilePhone(db.Model):
     model = db.Column(db.String(50), nullable=False)
     brand = db.Column(db.String(50), nullable=False)
     network_technologies = db.Column(db.String(100), nullable=False)
+    # Indexed bitmask mirror of network_technologies, kept in sync by the validator below.
+    network_mask = db.Column(db.Integer, nullable=False, default=0, index=True)
     number_of_cameras = db.Column(db.Integer, nullable=False)
     number_of_cores = db.Column(db.Integer, nullable=False)
     weight = db.Column(db.Integer, nullable=False)
     battery_capacity = db.Column(db.Integer, nullable=False)
     cost = db.Column(db.Float, nullable=False)
+    # Row version for optimistic concurrency: the ORM bumps it on every UPDATE and
+    # adds "AND version = <read value>" to the WHERE clause, so a concurrent
+    # change makes the flush fail with StaleDataError instead of being overwritten.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Catalogue version of the last insert or update of the row, so snapshots
+    # fetch only the rows changed since the version they hold.
+    changed_at = db.Column(db.Integer, nullable=False, default=CURRENT_CATALOGUE_VERSION,
+                           onupdate=CURRENT_CATALOGUE_VERSION, server_default='0', index=True)
+    __mapper_args__ = {'version_id_col': version}
     
     def __init__(self, serial_number: str, imei: str, model: str, brand: str,
                  network_technologies: list, number_of_cameras: int, number_of_cores: int,
                  weight: int, battery_capacity: int, cost: float):
-        self.serial_number = validate_serial_number(serial_number)
-        self.imei = validate_imei(imei)
-        self.model = validate_model(model)
-        self.brand = validate_brand(brand)
-        self.network_technologies = validate_network_technologies(network_technologies)
-        self.number_of_cameras = validate_number_of_cameras(number_of_cameras)
-        self.number_of_cores = validate_number_of_cores(number_of_cores)
-        self.weight = validate_weight(weight)
-        self.battery_capacity = validate_battery_capacity(battery_capacity)
-        self.cost = validate_cost(cost)
+        # Raises phoneValidator.ValidationError listing every invalid field.
+        values = PHONE_VALIDATOR.validate({
+            'serial_number': serial_number,
+            'imei': imei,
+            'model': model,
+            'brand': brand,
+            'network_technologies': network_technologies,
+            'number_of_cameras': number_of_cameras,
+            'number_of_cores': number_of_cores,
+            'weight': weight,
+            'battery_capacity': battery_capacity,
+            'cost': cost,
+        })
+        for field, value in values.items():
+            setattr(self, field, value)
         
+    @validates('network_technologies')
+    def _sync_network_mask(self, key, value):
+        self.network_mask = network_mask(value)
+        return value
+
     def __repr__(self):
         return (f"MobilePhone(serial_number='{self.serial_number}', imei='{self.imei}', "
                 f"model='{self.model}', brand='{self.brand}', "
@@ -57,10 +118,395 @@ class MobilePhone(db.Model):
             "imei": self.imei,
             "model": self.model,
             "brand": self.brand,
-            "network_technologies": self.network_technologies.split(","),  # Convert back to list.
+            "network_technologies": list(split_technologies(self.network_technologies)),  # Convert back to list.
             "number_of_cameras": self.number_of_cameras,
             "number_of_cores": self.number_of_cores,
             "weight": self.weight,
             "battery_capacity": self.battery_capacity,
-            "cost": self.cost
+            "cost": self.cost,
+            "version": self.version
         }
+
+# Full-text index over brand and model used by /phones/search (see search.py).
+# On SQLite it is an external-content FTS5 table kept in sync by triggers, so
+# core bulk statements maintain it too; on MySQL a FULLTEXT index.
+PHONE_FTS_TABLE = 'mobile_phones_fts'
+PHONE_FULLTEXT_INDEX = 'ft_mobile_phones_brand_model'
+SQLITE_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {PHONE_FTS_TABLE} USING fts5("
+    f"brand, model, content='mobile_phones', content_rowid='id', prefix='1 2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {PHONE_FTS_TABLE}_insert AFTER INSERT ON mobile_phones BEGIN "
+    f"INSERT INTO {PHONE_FTS_TABLE}(rowid, brand, model) VALUES (new.id, new.brand, new.model); END",
+    f"CREATE TRIGGER IF NOT EXISTS {PHONE_FTS_TABLE}_delete AFTER DELETE ON mobile_phones BEGIN "
+    f"INSERT INTO {PHONE_FTS_TABLE}({PHONE_FTS_TABLE}, rowid, brand, model) "
+    f"VALUES ('delete', old.id, old.brand, old.model); END",
+    f"CREATE TRIGGER IF NOT EXISTS {PHONE_FTS_TABLE}_update AFTER UPDATE OF brand, model ON mobile_phones BEGIN "
+    f"INSERT INTO {PHONE_FTS_TABLE}({PHONE_FTS_TABLE}, rowid, brand, model) "
+    f"VALUES ('delete', old.id, old.brand, old.model); "
+    f"INSERT INTO {PHONE_FTS_TABLE}(rowid, brand, model) VALUES (new.id, new.brand, new.model); END",
+)
+SQLITE_FTS_DROP = (
+    f"DROP TRIGGER IF EXISTS {PHONE_FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {PHONE_FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {PHONE_FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {PHONE_FTS_TABLE}",
+)
+MYSQL_FULLTEXT_DDL = f"ALTER TABLE mobile_phones ADD FULLTEXT INDEX {PHONE_FULLTEXT_INDEX} (brand, model)"
+
+def has_fts5(connection):
+    return any('ENABLE_FTS5' in option for (option,) in connection.exec_driver_sql("PRAGMA compile_options"))
+
+def _sqlite_fts5(ddl, target, bind, **kw):
+    return bind.dialect.name == 'sqlite' and has_fts5(bind)
+
+for statement in SQLITE_FTS_DDL:
+    event.listen(MobilePhone.__table__, 'after_create', DDL(statement).execute_if(callable_=_sqlite_fts5))
+for statement in SQLITE_FTS_DROP:
+    event.listen(MobilePhone.__table__, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(MobilePhone.__table__, 'after_create', DDL(MYSQL_FULLTEXT_DDL).execute_if(dialect='mysql'))
+
+def create_search_index(engine):
+    """Add the full-text index to a catalogue created before it existed. Returns True if it was created."""
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite' and has_fts5(connection):
+            if inspect(connection).has_table(PHONE_FTS_TABLE):
+                return False
+            for statement in SQLITE_FTS_DDL:
+                connection.exec_driver_sql(statement)
+            # Index the rows that already exist.
+            connection.exec_driver_sql(f"INSERT INTO {PHONE_FTS_TABLE}({PHONE_FTS_TABLE}) VALUES ('rebuild')")
+            return True
+        if engine.dialect.name == 'mysql':
+            existing = {index['name'] for index in inspect(connection).get_indexes('mobile_phones')}
+            if PHONE_FULLTEXT_INDEX not in existing:
+                connection.exec_driver_sql(MYSQL_FULLTEXT_DDL)
+                return True
+    return False
+
+class CatalogueState(db.Model):
+    """Single-row table holding a counter bumped by every write to mobile_phones.
+
+    Readers use it to build ETags: if the version has not moved, no catalogue
+    response has changed either.
+    """
+    __tablename__ = 'catalogue_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+@event.listens_for(CatalogueState.__table__, 'after_create')
+def _seed_catalogue_state(target, connection, **kw):
+    connection.execute(target.insert().values(id=1, version=0))
+
+def bump_catalogue_version(session):
+    # Call first in the writing transaction, before any locking read or write, so the new
+    # version commits (or rolls back) with the data and the rows written after it are stamped
+    # with it (changed_at). Lock order: catalogue_state, then mobile_phones rows, then
+    # catalogue_aggregates. Holding the first lock until commit makes writers commit in
+    # version order, and also serializes them: one write transaction runs at a time, as
+    # SQLite does anyway.
+    # Returns session.execute()'s result, so AsyncSession callers can await it.
+    return session.execute(update(CatalogueState).where(CatalogueState.id == 1)
+                           .values(version=CatalogueState.version + 1))
+
+def catalogue_version_query():
+    return select(CatalogueState.version).where(CatalogueState.id == 1)
+
+def get_catalogue_version(session):
+    return session.scalar(catalogue_version_query()) or 0
+
+class DeletedPhone(db.Model):
+    """Tombstone of a deleted phone, stamped with the catalogue version that deleted it.
+
+    Together with MobilePhone.changed_at it lets snapshots apply every change
+    made after a given version without scanning mobile_phones. Tombstones are
+    two integers each and are kept, since a snapshot may be any version behind.
+    """
+    __tablename__ = 'deleted_phones'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    phone_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.Integer, nullable=False, default=CURRENT_CATALOGUE_VERSION, index=True)
+
+def record_deletions(session, phone_ids):
+    # Call after bump_catalogue_version in the deleting transaction; awaitable like it.
+    return session.execute(insert(DeletedPhone), [{'phone_id': phone_id} for phone_id in phone_ids])
+
+class CatalogueAggregate(db.Model):
+    """Per-group phone count and cost totals, maintained by every write.
+
+    One row per (dimension, key), e.g. ('brand', 'Nokia'), ('network_technologies', '5G')
+    or ('number_of_cores', '8'), so /phones/stats reads O(groups) rows.
+    """
+    __tablename__ = 'catalogue_aggregates'
+
+    dimension = db.Column(db.String(32), primary_key=True)
+    key = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    cost_sum = db.Column(db.Float, nullable=False)
+    cost_min = db.Column(db.Float, nullable=False)
+    cost_max = db.Column(db.Float, nullable=False)
+
+AGGREGATE_DIMENSIONS = ('brand', 'network_technologies', 'number_of_cores')
+
+def _aggregate_keys(phone):
+    # phone is a to_dict()/row_to_dict()-shaped dict; technologies may also be the stored string.
+    for dimension in AGGREGATE_DIMENSIONS:
+        value = phone[dimension]
+        if dimension == 'network_technologies':
+            yield from ((dimension, tech) for tech in (split_technologies(value) if isinstance(value, str) else value))
+        else:
+            yield dimension, str(value)
+
+def _group_condition(dimension, key):
+    if dimension == 'network_technologies':
+        return MobilePhone.network_mask.in_(masks_including(key))
+    return getattr(MobilePhone, dimension) == MobilePhone.__table__.c[dimension].type.python_type(key)
+
+def _group_totals(session, dimension, key):
+    return session.execute(
+        select(func.count(), func.sum(MobilePhone.cost), func.min(MobilePhone.cost), func.max(MobilePhone.cost))
+        .where(_group_condition(dimension, key))
+    ).one()
+
+def _add_to_groups(session, rows):
+    """Add phones to groups with one upsert, creating the groups that are new.
+
+    SELECT ... FOR UPDATE on a group that does not exist yet only takes an
+    InnoDB gap lock, which does not stop a concurrent transaction from taking
+    the same lock, so two writers creating one group both INSERT and deadlock.
+    An upsert makes the second writer wait on the first one's row instead.
+    Rows are sorted so concurrent writers lock shared groups in the same order.
+    """
+    table = CatalogueAggregate.__table__
+    columns = table.c
+    if session.get_bind().dialect.name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update(
+            count=columns['count'] + statement.inserted['count'],
+            cost_sum=columns.cost_sum + statement.inserted.cost_sum,
+            cost_min=func.least(columns.cost_min, statement.inserted.cost_min),
+            cost_max=func.greatest(columns.cost_max, statement.inserted.cost_max))
+    else:
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(index_elements=[columns.dimension, columns.key], set_={
+            'count': columns['count'] + statement.excluded['count'],
+            'cost_sum': columns.cost_sum + statement.excluded.cost_sum,
+            'cost_min': func.min(columns.cost_min, statement.excluded.cost_min),
+            'cost_max': func.max(columns.cost_max, statement.excluded.cost_max)})
+    session.execute(statement, sorted(rows, key=lambda row: (row['dimension'], row['key'])))
+
+def apply_aggregate_changes(session, before=(), after=()):
+    """Fold a write into catalogue_aggregates inside the writing transaction.
+
+    before/after are the old and new versions of the changed phones, as sent
+    with phones_changed. Call it after the phones themselves were written.
+    Added phones are upserted into their groups first; groups that lost phones
+    are then locked and updated, and removing a group's current minimum or
+    maximum cost recomputes that group from mobile_phones (an indexed lookup).
+    """
+    added, removed = {}, {}  # (dimension, key) -> costs
+    for phones, groups in ((after, added), (before, removed)):
+        for phone in phones:
+            for group in _aggregate_keys(phone):
+                groups.setdefault(group, []).append(phone['cost'])
+
+    if added:
+        _add_to_groups(session, [
+            {'dimension': dimension, 'key': key, 'count': len(costs), 'cost_sum': sum(costs),
+             'cost_min': min(costs), 'cost_max': max(costs)}
+            for (dimension, key), costs in added.items()])
+    if not removed:
+        return
+
+    table = CatalogueAggregate.__table__
+    # Every group losing a phone exists already, so these are plain row locks.
+    existing = {(row.dimension, row.key): row for row in session.execute(
+        select(table).where(tuple_(table.c.dimension, table.c.key).in_(sorted(removed)))
+        .order_by(table.c.dimension, table.c.key).with_for_update())}
+    updates, deletes = [], []
+    for (dimension, key), costs in removed.items():
+        row = existing.get((dimension, key))
+        if row is None:
+            continue
+        if any(cost <= row.cost_min or cost >= row.cost_max for cost in costs):
+            values = tuple(_group_totals(session, dimension, key))
+        else:
+            values = (row.count - len(costs), row.cost_sum - sum(costs), row.cost_min, row.cost_max)
+        values = dict(zip(('count', 'cost_sum', 'cost_min', 'cost_max'), values))
+        if not values['count']:
+            deletes.append((dimension, key))
+        else:
+            updates.append(dict(values, b_dimension=dimension, b_key=key))
+
+    if updates:
+        session.execute(update(table)
+                        .where(table.c.dimension == bindparam('b_dimension'), table.c.key == bindparam('b_key'))
+                        .values(count=bindparam('count'), cost_sum=bindparam('cost_sum'),
+                                cost_min=bindparam('cost_min'), cost_max=bindparam('cost_max')), updates)
+    if deletes:
+        session.execute(delete(table).where(tuple_(table.c.dimension, table.c.key).in_(deletes)))
+
+def rebuild_aggregates(connection):
+    """Recompute catalogue_aggregates from mobile_phones with one GROUP BY per dimension."""
+    totals = (func.count(), func.sum(MobilePhone.cost), func.min(MobilePhone.cost), func.max(MobilePhone.cost))
+    groups = {}
+    for dimension in ('brand', 'number_of_cores'):
+        column = getattr(MobilePhone, dimension)
+        for key, *values in connection.execute(select(column, *totals).group_by(column)):
+            groups[(dimension, str(key))] = values
+    # Technologies are grouped by mask, then each mask's totals go to every technology it contains.
+    for mask, count, cost_sum, cost_min, cost_max in connection.execute(
+            select(MobilePhone.network_mask, *totals).group_by(MobilePhone.network_mask)):
+        for tech in NETWORK_TECHNOLOGIES:
+            if not mask & NETWORK_BITS[tech]:
+                continue
+            group = groups.setdefault(('network_technologies', tech), [0, 0.0, cost_min, cost_max])
+            group[0] += count
+            group[1] += cost_sum
+            group[2] = min(group[2], cost_min)
+            group[3] = max(group[3], cost_max)
+
+    table = CatalogueAggregate.__table__
+    connection.execute(delete(table))
+    if groups:
+        connection.execute(insert(table), [
+            {'dimension': dimension, 'key': key, 'count': count, 'cost_sum': cost_sum,
+             'cost_min': cost_min, 'cost_max': cost_max}
+            for (dimension, key), (count, cost_sum, cost_min, cost_max) in groups.items()])
+
+def catalogue_stats(session, dimensions=AGGREGATE_DIMENSIONS):
+    """Read the aggregates as {dimension: [{key, count, avg_cost, min_cost, max_cost}, ...]}."""
+    table = CatalogueAggregate.__table__
+    stats = {dimension: [] for dimension in dimensions}
+    for row in session.execute(select(table).where(table.c.dimension.in_(dimensions))):
+        key = int(row.key) if row.dimension == 'number_of_cores' else row.key
+        stats[row.dimension].append({
+            "key": key,
+            "count": row.count,
+            "avg_cost": round(row.cost_sum / row.count, 2),
+            "min_cost": row.cost_min,
+            "max_cost": row.cost_max,
+        })
+    for groups in stats.values():
+        groups.sort(key=lambda group: group['key'])
+    return stats
+
+# Columns used for storage only; they are not exposed to or settable by clients.
+INTERNAL_COLUMNS = {'network_mask', 'changed_at'}
+PUBLIC_FIELDS = [column for column in MobilePhone.__table__.columns.keys() if column not in INTERNAL_COLUMNS]
+
+def migrate_network_technologies(engine, batch_size=1000):
+    """Add and backfill network_mask on tables created before it existed."""
+    table = MobilePhone.__table__
+    columns = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        if 'network_mask' not in columns:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN network_mask INTEGER NOT NULL DEFAULT 0"))
+            for index in table.indexes:
+                if 'network_mask' in index.columns:
+                    index.create(conn)
+
+        # A bare table for the backfill, which is no catalogue change and must not stamp changed_at.
+        phones = sql_table(table.name, column('id'), column('network_mask'))
+        # Every stored phone has at least one technology, so a zero mask means "not backfilled yet".
+        while True:
+            rows = conn.execute(
+                select(table.c.id, table.c.network_technologies)
+                .where(table.c.network_mask == 0).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            ids_by_mask = {}
+            for row in rows:
+                ids_by_mask.setdefault(network_mask(row.network_technologies), []).append(row.id)
+            for mask, ids in ids_by_mask.items():
+                conn.execute(update(phones).where(phones.c.id.in_(ids)).values(network_mask=mask))
+
+def migrate_row_version(engine):
+    """Add the version column to tables created before it existed; every row starts at 1."""
+    table = MobilePhone.__table__
+    if 'version' not in {column['name'] for column in inspect(engine).get_columns(table.name)}:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+def migrate_change_tracking(engine):
+    """Add changed_at to tables created before it existed; existing rows predate every snapshot."""
+    table = MobilePhone.__table__
+    if 'changed_at' not in {column['name'] for column in inspect(engine).get_columns(table.name)}:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN changed_at INTEGER NOT NULL DEFAULT 0"))
+
+def missing_indexes(engine):
+    """Return the declared indexes on mobile_phones that the database does not have."""
+    table = MobilePhone.__table__
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return sorted(table.indexes, key=lambda index: index.name)
+    existing = {index['name'] for index in inspector.get_indexes(table.name)}
+    return sorted((index for index in table.indexes if index.name not in existing),
+                  key=lambda index: index.name)
+
+def init_schema(engine):
+    """Create missing tables and indexes, run the data migrations and rebuild the aggregates.
+
+    Returns the indexes that had to be added to an existing table.
+    """
+    db.metadata.create_all(engine)
+    migrate_network_technologies(engine)
+    migrate_row_version(engine)
+    migrate_change_tracking(engine)
+    # create_all() never adds indexes to an existing table.
+    created = missing_indexes(engine)
+    for index in created:
+        index.create(engine)
+    create_search_index(engine)
+    # Also repairs any drift, e.g. from rows written by tools that bypass the API.
+    with engine.begin() as connection:
+        rebuild_aggregates(connection)
+    return created
+
+class MonitoredQueuePool(QueuePool):
+    """QueuePool that counts checkouts which had to wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # Same condition QueuePool uses to decide to block: no idle connection
+        # and no overflow slot left.
+        exhausted = (self._max_overflow > -1 and self.overflow() >= self._max_overflow
+                     and self.checkedin() == 0)
+        if not exhausted:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waits += 1
+            self.wait_time += time.perf_counter() - start
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, MonitoredQueuePool):
+        stats.update(waits=pool.waits, wait_time_ms=round(pool.wait_time * 1000, 3), timeouts=pool.timeouts)
+    return stats
@@ -0,0 +1,15 @@
+# Gunicorn settings; start with: gunicorn -c gunicorn.conf.py
+# [server] mode (or SERVER_MODE) picks the sync Flask app or the async ASGI app.
+from read_config import get_setting
+
+bind = "0.0.0.0:5000"
+workers = get_setting('server', 'workers', default=1, cast=int)
+
+if get_setting('server', 'mode', default='wsgi') == 'asgi':
+    wsgi_app = "asgi_app:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "MainInterface:app"
+    # Building the app no longer opens database connections, so it can be
+    # imported once in the master and shared by every forked worker.
+    preload_app = True
@@ -0,0 +1,110 @@
+"""Idempotency-Key support for the write endpoints.
+
+A client that retries a write sends the same Idempotency-Key header each
+time. The first request runs and its response is stored; retries with the
+same key and body get the stored response back (marked Idempotent-Replayed)
+without touching the database. Keys are scoped to the method and path, live
+for [idempotency] ttl seconds, and sit in a cache from cache.py, so
+`backend = shared` makes retries landing on another worker replay too. The
+Flask routes use the idempotent decorator; asgi_app.py calls claim() and
+finish() itself, with the same keys, so either entry point can replay.
+While the first request runs, the key is only claimed for [idempotency]
+lease seconds, so a worker dying mid-request does not block retries for
+the whole ttl. Keep the lease above the request timeout.
+
+  same key, different body      422
+  same key, first still running 409
+  first attempt failed with 5xx key released, the retry runs again
+"""
+import hashlib
+import json
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+
+from serializer import dumps_bytes
+
+MAX_KEY_LENGTH = 255
+# Headers of the original response that are replayed with its body.
+REPLAYED_HEADERS = ('Content-Type', 'ETag', 'Location')
+
+class IdempotencyError(Exception):
+    """The Idempotency-Key cannot be used for this request; status is 400, 409 or 422."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+def request_fingerprint(query_string, body):
+    digest = hashlib.sha256(query_string)
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+def store_key(method, path, key):
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.", 400)
+    return f"idempotency:{method}:{path}:{key}"
+
+def claim(store, key, fingerprint, lease):
+    """Claim key before running the write; returns None, or the stored entry of a finished one to replay.
+
+    Shared by the Flask and ASGI entry points, so with a shared store a retry
+    may land on either.
+    """
+    # Claim the key before running the view, so concurrent retries cannot both write.
+    if store.add(key, dumps_bytes({"fingerprint": fingerprint}), ttl=lease):
+        return None
+    stored = store.get(key)
+    entry = json.loads(stored) if stored is not None else {}
+    if entry.get('fingerprint', fingerprint) != fingerprint:
+        raise IdempotencyError("Idempotency-Key was already used with a different request.", 422)
+    if 'status' not in entry:
+        raise IdempotencyError("A request with this Idempotency-Key is still in progress.", 409)
+    return entry
+
+def finish(store, key, fingerprint, status, headers, body, streamed=False):
+    """Store the response for replay, or release the key so a retry runs again."""
+    if status >= 500 or streamed:
+        store.delete(key)
+    else:
+        store.set(key, dumps_bytes({
+            "fingerprint": fingerprint,
+            "status": status,
+            "headers": {name: headers[name] for name in REPLAYED_HEADERS if name in headers},
+            "body": body,
+        }))
+
+def _replay(entry):
+    response = current_app.response_class(entry['body'], entry['status'])
+    for name, value in entry['headers'].items():
+        response.headers[name] = value
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(view):
+    """Replay the stored response of a write retried with the same Idempotency-Key."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        store = current_app.extensions['idempotency_store']
+        fingerprint = request_fingerprint(request.query_string, request.get_data())
+        try:
+            key = store_key(request.method, request.path, key)
+            entry = claim(store, key, fingerprint, current_app.config['IDEMPOTENCY_LEASE'])
+        except IdempotencyError as e:
+            return jsonify({"error": str(e)}), e.status
+        if entry is not None:
+            return _replay(entry)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            store.delete(key)
+            raise
+        finish(store, key, fingerprint, response.status_code, response.headers,
+               None if response.is_streamed else response.get_data(as_text=True), response.is_streamed)
+        return response
+    return wrapper
@@ -0,0 +1,202 @@
+"""Per-route request metrics exposed in the Prometheus text format at /metrics.
+
+Each gunicorn worker keeps its own counters, like any in-process Prometheus
+client, so scrape the workers (or run one worker per pod) to see them all.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+PREFIX = 'phone_api'
+
+slow_query_logger = logging.getLogger('phone_api.slow_queries')
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            yield bound, total
+
+class RequestSample:
+    """What one request spent its time on; filled in while it runs."""
+
+    __slots__ = ('start', 'sql_statements', 'sql_time', 'serialization_time', 'serializing', 'size')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_time = 0.0
+        self.serialization_time = 0.0
+        self.serializing = False
+        self.size = 0
+
+def current_sample():
+    return g.get('metrics_sample') if has_app_context() else None
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(value)
+
+class Metrics:
+    """Registry for one app; observe() is called once per finished request."""
+
+    def __init__(self):
+        self.requests = {}      # (method, route, status) -> count
+        self.latency = {}       # (method, route) -> Histogram
+        self.sizes = {}         # (method, route) -> Histogram
+        self.sql_statements = {}  # route -> count
+        self.sql_time = {}      # route -> seconds
+        self.serialization_time = {}  # route -> seconds
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, sample):
+        duration = time.perf_counter() - sample.start
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault((method, route), Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.sizes.setdefault((method, route), Histogram(SIZE_BUCKETS)).observe(sample.size)
+            self.sql_statements[route] = self.sql_statements.get(route, 0) + sample.sql_statements
+            self.sql_time[route] = self.sql_time.get(route, 0.0) + sample.sql_time
+            self.serialization_time[route] = self.serialization_time.get(route, 0.0) + sample.serialization_time
+
+    def count_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            lines.extend(f"{PREFIX}_{name}{labels} {value}" for labels, value in samples)
+
+        def histogram(name, help_text, histograms):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} histogram")
+            for (method, route), hist in sorted(histograms.items()):
+                for bound, count in hist.cumulative():
+                    lines.append(f"{PREFIX}_{name}_bucket{_labels(method=method, route=route, le=_bound(bound))} {count}")
+                labels = _labels(method=method, route=route)
+                lines.append(f"{PREFIX}_{name}_sum{labels} {hist.sum}")
+                lines.append(f"{PREFIX}_{name}_count{labels} {hist.count}")
+
+        with self._lock:
+            metric('http_requests_total', 'counter', "Requests served, by route, method and status.",
+                   [(_labels(method=method, route=route, status=status), count)
+                    for (method, route, status), count in sorted(self.requests.items())])
+            histogram('http_request_duration_seconds', "Time from routing to the response (last byte for streams).",
+                      self.latency)
+            histogram('http_response_size_bytes', "Response body size.", self.sizes)
+            metric('db_statements_total', 'counter', "SQL statements executed while serving each route.",
+                   [(_labels(route=route), count) for route, count in sorted(self.sql_statements.items())])
+            metric('db_statement_seconds_total', 'counter', "Time spent in SQL statements, by route.",
+                   [(_labels(route=route), seconds) for route, seconds in sorted(self.sql_time.items())])
+            metric('serialization_seconds_total', 'counter', "Time spent encoding JSON, by route.",
+                   [(_labels(route=route), seconds) for route, seconds in sorted(self.serialization_time.items())])
+            metric('slow_queries_total', 'counter', "SQL statements slower than [metrics] slow_query_ms.",
+                   [('', self.slow_queries)])
+        return "\n".join(lines) + "\n"
+
+def _timed(method):
+    # Serialization can nest (DefaultJSONProvider.response calls dumps); only the outer call is timed.
+    def wrapper(self, *args, **kwargs):
+        sample = current_sample()
+        if sample is None or sample.serializing:
+            return method(self, *args, **kwargs)
+        sample.serializing = True
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            sample.serializing = False
+            sample.serialization_time += time.perf_counter() - start
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+def timed_json_provider(provider_class):
+    """Subclass a JSON provider so its encoding time is charged to the current request."""
+    return type(f"Timed{provider_class.__name__}", (provider_class,), {
+        'dumps': _timed(provider_class.dumps),
+        'response': _timed(provider_class.response),
+    })
+
+def _counting(chunks, sample):
+    for chunk in chunks:
+        sample.size += len(chunk)
+        yield chunk
+
+def instrument_engine(engine, metrics, slow_query_ms=0):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        sample = current_sample()
+        if sample is not None:
+            sample.sql_statements += 1
+            sample.sql_time += elapsed
+        if slow_query_ms and elapsed * 1000 >= slow_query_ms:
+            metrics.count_slow_query()
+            slow_query_logger.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000,
+                                      request.path if sample is not None else "-", " ".join(statement.split()))
+
+def _start_request():
+    g.metrics_sample = RequestSample()
+
+def _finish_request(response):
+    sample = g.get('metrics_sample')
+    if sample is None:
+        return response
+    metrics = current_app.extensions['metrics']
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status = request.method, response.status_code
+    if response.is_streamed:
+        # Streamed bodies are sized and timed as they are sent; the server
+        # closes the response after the last chunk.
+        response.response = _counting(response.iter_encoded(), sample)
+        response.call_on_close(lambda: metrics.observe(method, route, status, sample))
+    else:
+        sample.size = response.calculate_content_length() or 0
+        metrics.observe(method, route, status, sample)
+    return response
+
+def metrics_endpoint():
+    return Response(current_app.extensions['metrics'].render(), 200,
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def init_app(app, engines, slow_query_ms=0):
+    metrics = app.extensions['metrics'] = Metrics()
+    for engine in engines:
+        instrument_engine(engine, metrics, slow_query_ms)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+    return metrics
@@ -1,53 +1,159 @@
-ALLOWED_NETWORKS = {"GSM", "HSPA", "LTE", "3G", "4G", "5G"}
-
-def validate_serial_number(serial_number):
-    if not (len(serial_number) == 11 and serial_number.isalnum()):
-        raise ValueError("Serial number must be exactly 11 alphanumeric characters.")
-    return serial_number
-
-def validate_imei(imei):
-    if not (len(imei) == 15 and imei.isdigit()):
-        raise ValueError("IMEI must be exactly 15 digits.")
-    return imei
-
-def validate_model(model):
-    if not (len(model) >= 2 and model.isalnum()):
-        raise ValueError("Model must be alphanumeric and at least 2 characters long.")
-    return model
-
-def validate_brand(brand):
-    if not (len(brand) >= 2 and brand.isalpha()):
-        raise ValueError("Brand must contain only letters and be at least 2 characters long.")
-    return brand
-
-def validate_network_technologies(network_technologies):
-    if not (isinstance(network_technologies, list) and network_technologies):
-        raise ValueError("Network technologies must be provided as a non-empty list.")
-    if not all(tech in ALLOWED_NETWORKS for tech in network_technologies):
-        raise ValueError(f"Network technologies must be among: {', '.join(ALLOWED_NETWORKS)}.")
-    return ",".join(network_technologies)
-
-def validate_number_of_cameras(number_of_cameras):
-    if not (isinstance(number_of_cameras, int) and 1 <= number_of_cameras <= 3):
-        raise ValueError("Number of cameras must be an integer between 1 and 3.")
-    return number_of_cameras
-
-def validate_number_of_cores(number_of_cores):
-    if not (isinstance(number_of_cores, int) and number_of_cores >= 1):
-        raise ValueError("Number of cores must be an integer greater than or equal to 1.")
-    return number_of_cores
-
-def validate_weight(weight):
-    if not (isinstance(weight, int) and weight > 0):
-        raise ValueError("Weight must be a positive integer (in grams).")
-    return weight
-
-def validate_battery_capacity(battery_capacity):
-    if not (isinstance(battery_capacity, int) and battery_capacity > 0):
-        raise ValueError("Battery capacity must be a positive integer (in mAh).")
-    return battery_capacity
-
-def validate_cost(cost):
-    if not (isinstance(cost, (int, float)) and cost > 0):
-        raise ValueError("Cost must be a positive number (in euros).")
-    return float(cost)
\ No newline at end of file
+# Order matters: MobilePhone.network_mask assigns bits in this order, so new
+# technologies must be appended at the end.
+NETWORK_TECHNOLOGIES = ("GSM", "HSPA", "LTE", "3G", "4G", "5G")
+ALLOWED_NETWORKS = set(NETWORK_TECHNOLOGIES)
+
+# Fields clients may never change once a phone exists.
+IMMUTABLE_FIELDS = ('serial_number', 'imei', 'model', 'brand')
+
+# Validation rules for a phone record. RecordValidator compiles them once into
+# a single generated check function that reports every failing field, not
+# just the first one.
+PHONE_SCHEMA = {
+    'serial_number': {'type': str, 'length': 11, 'charset': 'alnum',
+                      'error': "Serial number must be exactly 11 alphanumeric characters."},
+    'imei': {'type': str, 'length': 15, 'charset': 'digit',
+             'error': "IMEI must be exactly 15 digits."},
+    'model': {'type': str, 'min_length': 2, 'charset': 'alnum',
+              'error': "Model must be alphanumeric and at least 2 characters long."},
+    'brand': {'type': str, 'min_length': 2, 'charset': 'alpha',
+              'error': "Brand must contain only letters and be at least 2 characters long."},
+    'network_technologies': {'type': list, 'min_length': 1, 'choices': ALLOWED_NETWORKS, 'convert': ",".join,
+                             'error': "Network technologies must be provided as a non-empty list.",
+                             'choices_error': f"Network technologies must be among: {', '.join(ALLOWED_NETWORKS)}."},
+    'number_of_cameras': {'type': int, 'min': 1, 'max': 3,
+                          'error': "Number of cameras must be an integer between 1 and 3."},
+    'number_of_cores': {'type': int, 'min': 1,
+                        'error': "Number of cores must be an integer greater than or equal to 1."},
+    'weight': {'type': int, 'min': 1,
+               'error': "Weight must be a positive integer (in grams)."},
+    'battery_capacity': {'type': int, 'min': 1,
+                         'error': "Battery capacity must be a positive integer (in mAh)."},
+    'cost': {'type': (int, float), 'exclusive_min': 0, 'convert': float,
+             'error': "Cost must be a positive number (in euros)."},
+}
+
+class ValidationError(ValueError):
+    """Raised with every failing field; errors maps field name to message."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(" ".join(errors.values()))
+
+def _all_in(values, choices):
+    try:
+        return choices.issuperset(values)
+    except TypeError:  # unhashable items can never be valid choices
+        return False
+
+def _conditions(spec):
+    # Python expressions over the value 'v' for one field. The type check comes
+    # first so later conditions can assume the right type; choices get their own message.
+    conditions = [f"isinstance(v, {spec['type_name']})"]
+    if 'length' in spec:
+        conditions.append(f"len(v) == {spec['length']!r}")
+    if 'min_length' in spec:
+        conditions.append(f"len(v) >= {spec['min_length']!r}")
+    if 'charset' in spec:
+        conditions.append(f"v.is{spec['charset']}()")
+    if 'min' in spec:
+        conditions.append(f"v >= {spec['min']!r}")
+    if 'max' in spec:
+        conditions.append(f"v <= {spec['max']!r}")
+    if 'exclusive_min' in spec:
+        conditions.append(f"v > {spec['exclusive_min']!r}")
+    groups = [(" and ".join(conditions), spec['error'])]
+    if 'choices' in spec:
+        groups.append((f"_all_in(v, {spec['choices_name']})", spec['choices_error']))
+    return groups
+
+def compile_schema(schema):
+    """Generate and compile one check(record, partial) function for the whole schema.
+
+    Each field becomes an inline block of comparisons, so validating a record
+    costs no per-field function calls or exceptions.
+    """
+    namespace = {'_all_in': _all_in}
+    lines = ["def check(record, partial=False):", "    values = {}", "    errors = {}"]
+    for i, (field, spec) in enumerate(schema.items()):
+        spec = dict(spec, type_name=f"_type_{i}", choices_name=f"_choices_{i}")
+        namespace[f"_type_{i}"] = spec['type']
+        namespace[f"_choices_{i}"] = frozenset(spec.get('choices', ()))
+        namespace[f"_convert_{i}"] = spec.get('convert')
+        lines += [f"    if {field!r} in record:", f"        v = record[{field!r}]"]
+        for j, (condition, message) in enumerate(_conditions(spec)):
+            lines += [f"        {'if' if j == 0 else 'elif'} not ({condition}):",
+                      f"            errors[{field!r}] = {message!r}"]
+        value = f"_convert_{i}(v)" if spec.get('convert') else "v"
+        lines += ["        else:", f"            values[{field!r}] = {value}",
+                  "    elif not partial:", f"        errors[{field!r}] = {f'Missing required field: {field!r}'!r}"]
+    lines.append("    return values, errors")
+    exec("\n".join(lines), namespace)
+    return namespace['check']
+
+class RecordValidator:
+    """Validator compiled once from a schema like PHONE_SCHEMA."""
+
+    def __init__(self, schema):
+        self.fields = tuple(schema)
+        self._check = compile_schema(schema)
+
+    def check(self, record, partial=False):
+        """Return (values, errors) for one record.
+
+        values holds the converted value of every valid field; errors maps each
+        invalid field to its message. With partial=True only the fields present
+        are checked, as for an update.
+        """
+        return self._check(record, partial)
+
+    def check_many(self, records):
+        """Validate a list of records in one pass; returns a (values, errors) pair per record."""
+        check = self._check
+        return [check(record) if isinstance(record, dict) else (None, {'record': "Record must be a JSON object."})
+                for record in records]
+
+    def validate(self, record, partial=False):
+        values, errors = self._check(record, partial)
+        if errors:
+            raise ValidationError(errors)
+        return values
+
+PHONE_VALIDATOR = RecordValidator(PHONE_SCHEMA)
+
+def validate_update(data):
+    """Validate a partial update and return the converted values.
+
+    Raises ValidationError for immutable or unknown fields and invalid values.
+    """
+    if not isinstance(data, dict):
+        raise ValidationError({'body': "Request body must be a JSON object."})
+    for field in data:
+        if field in IMMUTABLE_FIELDS:
+            raise ValidationError({field: f"Updating '{field}' is not allowed."})
+        if field not in PHONE_VALIDATOR.fields:
+            raise ValidationError({field: f"Invalid field: {field}"})
+    return PHONE_VALIDATOR.validate(data, partial=True)
+
+
+# Single-field validators, kept for callers that check one value at a time.
+# They share PHONE_SCHEMA's rules and return the converted value.
+def _field_validator(field):
+    def validate(value):
+        values, errors = PHONE_VALIDATOR.check({field: value}, partial=True)
+        if errors:
+            raise ValueError(errors[field])
+        return values[field]
+    validate.__name__ = f"validate_{field}"
+    return validate
+
+validate_serial_number = _field_validator('serial_number')
+validate_imei = _field_validator('imei')
+validate_model = _field_validator('model')
+validate_brand = _field_validator('brand')
+validate_network_technologies = _field_validator('network_technologies')
+validate_number_of_cameras = _field_validator('number_of_cameras')
+validate_number_of_cores = _field_validator('number_of_cores')
+validate_weight = _field_validator('weight')
+validate_battery_capacity = _field_validator('battery_capacity')
+validate_cost = _field_validator('cost')
@@ -0,0 +1,123 @@
+from dbmanager import MobilePhone, PUBLIC_FIELDS, masks_including
+from phoneValidator import ALLOWED_NETWORKS
+from serializer import select_phones
+
+# Query-string operators, e.g. ?cost__lt=500&number_of_cores__gte=8&brand__in=Nokia,Samsung
+OPERATORS = {
+    'eq': lambda column, value: column == value,
+    'ne': lambda column, value: column != value,
+    'lt': lambda column, value: column < value,
+    'lte': lambda column, value: column <= value,
+    'gt': lambda column, value: column > value,
+    'gte': lambda column, value: column >= value,
+    'in': lambda column, values: column.in_(values),
+}
+# network_technologies is a list, so it only supports "has" (eq) and "has any of" (in).
+NETWORK_OPERATORS = {'eq', 'in'}
+RESERVED_PARAMS = {'fields', 'sort', 'limit'}
+DEFAULT_SORT = ('brand', 'model', 'cost')
+MAX_QUERY_LIMIT = 1000
+
+def _convert(field, raw):
+    # Parse a query-string value into the column's Python type.
+    python_type = MobilePhone.__table__.c[field].type.python_type
+    try:
+        return python_type(raw)
+    except ValueError:
+        raise ValueError(f"Invalid value '{raw}' for field {field}. Expected {python_type.__name__}.")
+
+def _network_condition(operator, technologies):
+    masks = set()
+    for tech in technologies:
+        masks.update(masks_including(tech))
+    return MobilePhone.network_mask.in_(sorted(masks))
+
+def parse_criteria(args):
+    """Turn query parameters like cost__lt=500 into (field, operator, value) triples.
+
+    Values are converted to the column's type; 'in' takes a list, and so does
+    network_technologies (the technologies to look for) for both its operators.
+    """
+    criteria = []
+    for key in args:
+        if key in RESERVED_PARAMS:
+            continue
+        field, _, operator = key.partition('__')
+        operator = operator or 'eq'
+        if field not in PUBLIC_FIELDS:
+            raise ValueError(f"Invalid field: {field}")
+        if operator not in OPERATORS:
+            raise ValueError(f"Invalid operator '{operator}'. Expected one of: {', '.join(OPERATORS)}.")
+
+        for raw in args.getlist(key):
+            if field == 'network_technologies':
+                if operator not in NETWORK_OPERATORS:
+                    raise ValueError("network_technologies only supports the 'eq' and 'in' operators.")
+                technologies = raw.split(',') if operator == 'in' else [raw]
+                for tech in technologies:
+                    if tech not in ALLOWED_NETWORKS:
+                        raise ValueError(f"Network technologies must be among: {', '.join(ALLOWED_NETWORKS)}.")
+                criteria.append((field, operator, technologies))
+            elif operator == 'in':
+                criteria.append((field, operator, [_convert(field, item) for item in raw.split(',')]))
+            else:
+                criteria.append((field, operator, _convert(field, raw)))
+    return criteria
+
+def parse_filters(args):
+    """Turn query parameters like cost__lt=500 into SQL conditions."""
+    conditions = []
+    for field, operator, value in parse_criteria(args):
+        if field == 'network_technologies':
+            conditions.append(_network_condition(operator, value))
+        else:
+            conditions.append(OPERATORS[operator](getattr(MobilePhone, field), value))
+    return conditions
+
+def parse_fields(raw):
+    if not raw:
+        return list(PUBLIC_FIELDS)
+    fields = raw.split(',')
+    for field in fields:
+        if field not in PUBLIC_FIELDS:
+            raise ValueError(f"Invalid field: {field}")
+    return fields
+
+def parse_sort_keys(raw):
+    # "-cost,brand" sorts by cost descending, then brand ascending: [('cost', True), ('brand', False)].
+    keys = []
+    for item in (raw.split(',') if raw else DEFAULT_SORT):
+        field = item.lstrip('-')
+        if field not in PUBLIC_FIELDS or field == 'network_technologies':
+            raise ValueError(f"Invalid sort field: {field}")
+        keys.append((field, item.startswith('-')))
+    return keys
+
+def parse_sort(raw):
+    order_by = [getattr(MobilePhone, field).desc() if descending else getattr(MobilePhone, field)
+                for field, descending in parse_sort_keys(raw)]
+    # Tie-break on id so results are deterministic.
+    order_by.append(MobilePhone.id)
+    return order_by
+
+def parse_limit(raw):
+    if raw is None:
+        return None
+    if not raw.isdigit() or not 1 <= int(raw) <= MAX_QUERY_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_QUERY_LIMIT}.")
+    return int(raw)
+
+def build_query(args):
+    """Compile query parameters into a single SELECT over the requested columns.
+
+    Returns (statement, fields); each result row holds the columns in 'fields' order.
+    """
+    fields = parse_fields(args.get('fields'))
+    statement = select_phones(fields) \
+        .where(*parse_filters(args)) \
+        .order_by(*parse_sort(args.get('sort')))
+
+    limit = parse_limit(args.get('limit'))
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement, fields
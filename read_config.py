@@ -1,5 +1,13 @@
 import configparser
 import os
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def read_properties(config_file='config.properties'):
+    # Parsed once per process; app startup looks up a dozen settings.
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    return config
 
 def get_database_uri(config_file='config.properties'):
     # Check if DATABASE_URI is provided as an environment variable.
@@ -8,9 +16,78 @@ def get_database_uri(config_file='config.properties'):
         return env_db_uri
 
     # Fallback to reading from the properties file.
-    config = configparser.ConfigParser()
-    config.read(config_file)
-    return config['database']['uri']
+    return read_properties(config_file)['database']['uri']
+
+# Async drivers used in place of the sync ones by the ASGI entry point.
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def get_async_database_uri(config_file='config.properties'):
+    # ASYNC_DATABASE_URI wins; otherwise the regular URI is switched to the async driver.
+    env_db_uri = os.environ.get('ASYNC_DATABASE_URI')
+    if env_db_uri:
+        return env_db_uri
+
+    uri = get_database_uri(config_file)
+    scheme, separator, rest = uri.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+def get_setting(section, key, default=None, cast=str, env=None, config_file='config.properties'):
+    # Environment variables (e.g. INGEST_CHUNK_SIZE) take precedence over the properties file.
+    env_value = os.environ.get(env or f"{section}_{key}".upper())
+    if env_value is not None:
+        return cast(env_value)
+
+    config = read_properties(config_file)
+    if config.has_option(section, key):
+        return cast(config.get(section, key))
+    return default
+
+def get_replica_uris(config_file='config.properties'):
+    # Comma-separated; DATABASE_REPLICA_URIS overrides the properties file.
+    uris = get_setting('database', 'replica_uris', default='', config_file=config_file)
+    return [uri.strip() for uri in uris.split(',') if uri.strip()]
+
+def as_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# [database] keys passed straight through to create_engine, with their types.
+POOL_SETTINGS = {
+    'pool_size': int,
+    'max_overflow': int,
+    'pool_timeout': float,
+    'pool_recycle': int,
+}
+
+def get_engine_options(database_uri, config_file='config.properties'):
+    """Build SQLAlchemy engine options from [database] / DATABASE_* settings.
+
+    Queue sizing is skipped for in-memory SQLite, which runs on a single
+    static connection. statement_timeout is in milliseconds.
+    """
+    options = {
+        'pool_pre_ping': get_setting('database', 'pool_pre_ping', default=True, cast=as_bool,
+                                     config_file=config_file),
+    }
+    in_memory = database_uri.startswith('sqlite') and (':memory:' in database_uri or database_uri.endswith('://'))
+    for key, cast in POOL_SETTINGS.items():
+        if key == 'pool_recycle' or not in_memory:
+            value = get_setting('database', key, cast=cast, config_file=config_file)
+            if value is not None:
+                options[key] = value
+
+    timeout = get_setting('database', 'statement_timeout', cast=int, config_file=config_file)
+    if timeout:
+        if database_uri.startswith('mysql'):
+            # max_execution_time caps SELECT statements, which are the ones that pile up.
+            options['connect_args'] = {'init_command': f"SET SESSION max_execution_time={timeout}"}
+        elif database_uri.startswith('postgresql'):
+            options['connect_args'] = {'options': f"-c statement_timeout={timeout}"}
+        # SQLite has no server-side statement timeout; the setting is ignored there.
+    return options
 
 # Example usage:
 if __name__ == '__main__':
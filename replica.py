@@ -0,0 +1,102 @@
+import itertools
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import OperationalError
+
+# Cookie set on write responses; while it is valid, that client's reads go to
+# the primary so it sees its own writes despite replication lag.
+READ_PRIMARY_COOKIE = 'phone_api_read_primary_until'
+
+class ReplicaRouter:
+    """Round-robin choice among read replicas, skipping ones that recently failed."""
+
+    def __init__(self, engines=(), retry_after=30, read_after_write_window=5):
+        self.engines = list(engines)
+        self.retry_after = retry_after
+        self.read_after_write_window = read_after_write_window
+        self._down_until = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, engine):
+        self.engines.append(engine)
+
+    def remove(self, engine):
+        self.engines.remove(engine)
+        self._down_until.pop(engine, None)
+
+    def pick(self):
+        # Returns None when no replica is healthy; callers then use the primary.
+        engines = self.engines
+        if not engines:
+            return None
+        now = time.monotonic()
+        start = next(self._counter)
+        for offset in range(len(engines)):
+            engine = engines[(start + offset) % len(engines)]
+            if self._down_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+    def mark_down(self, engine):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_after
+
+    def stats(self):
+        now = time.monotonic()
+        return [{"url": engine.url.render_as_string(hide_password=True),
+                 "healthy": self._down_until.get(engine, 0) <= now} for engine in self.engines]
+
+class RoutingSession(Session):
+    """Session that sends statements to the replica chosen for the current request.
+
+    Anything flushed (inserts/updates/deletes) always goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('replica_engine')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def wants_primary():
+    # Clients can ask for primary reads explicitly, and recent writers get them automatically.
+    if request.headers.get('X-Read-Consistency') == 'strong':
+        return True
+    until = request.cookies.get(READ_PRIMARY_COOKIE, '')
+    return until.isdigit() and int(until) >= time.time()
+
+def read_only(view):
+    """Run a read-only view on a replica, falling back to the primary if it fails."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get('replica_router')
+        if router is None or wants_primary():
+            return view(*args, **kwargs)
+        g.replica_engine = router.pick()
+        if g.replica_engine is None:
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            router.mark_down(g.replica_engine)
+            current_app.logger.warning(f"Replica {g.replica_engine.url} failed; retrying on the primary.")
+            current_app.extensions['sqlalchemy'].session.rollback()
+            g.replica_engine = None
+            return view(*args, **kwargs)
+    return wrapper
+
+def mark_primary_reads(response):
+    # after_request hook: successful writes pin the client's reads to the primary for a while.
+    router = current_app.extensions.get('replica_router')
+    if router is None or not router.engines:
+        return response
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        window = router.read_after_write_window
+        response.set_cookie(READ_PRIMARY_COOKIE, str(int(time.time() + window)), max_age=window)
+    return response
@@ -0,0 +1,286 @@
+"""Type-ahead search over brand and model for /phones/search.
+
+A query like "sam gal" matches phones having a brand or model word starting
+with every query token. Phones where every token is a whole word come first,
+then the other prefix matches, each tier in catalogue (id) order. Walking
+both tiers in id order lets every backend stop after `limit` hits instead of
+scoring every match, which keeps one- and two-letter queries fast on a large
+catalogue. Three backends answer it:
+  fts      SQLite FTS5 table or MySQL FULLTEXT index, both created with the
+           schema by dbmanager
+  trie     an in-process prefix trie, used when no full-text index is available
+  auto     fts when the database has the index, the trie otherwise
+"""
+import heapq
+import threading
+import time
+import re
+from bisect import bisect_left, insort
+
+from sqlalchemy import and_, inspect, or_, select, text
+
+from dbmanager import (
+    MobilePhone, PHONE_FTS_TABLE, PHONE_FULLTEXT_INDEX, get_catalogue_version, has_fts5,
+)
+from serializer import row_to_dict, select_phones
+from signals import phones_changed
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+# InnoDB ignores shorter words in FULLTEXT queries (innodb_ft_min_token_size).
+MYSQL_MIN_TOKEN_SIZE = 3
+
+def tokenize(value):
+    return re.findall(r'[0-9a-z]+', value.lower())
+
+def _rows_in_order(session, ids):
+    # Fetch the public columns of the ranked ids and keep the ranking order.
+    if not ids:
+        return []
+    rows = {row.id: row for row in session.execute(select_phones().where(MobilePhone.id.in_(ids)))}
+    return [row_to_dict(rows[phone_id]) for phone_id in ids if phone_id in rows]
+
+def _merge_tiers(exact, prefixed, limit):
+    seen = set(exact)
+    return (exact + [phone_id for phone_id in prefixed if phone_id not in seen])[:limit]
+
+class SqliteFullTextSearch:
+    name = 'fts'
+
+    @staticmethod
+    def _match(session, match, limit):
+        # Without a rank ORDER BY, FTS5 walks its doclists in rowid order and stops at LIMIT.
+        return session.scalars(text(
+            f"SELECT rowid FROM {PHONE_FTS_TABLE} WHERE {PHONE_FTS_TABLE} MATCH :match ORDER BY rowid LIMIT :limit"
+        ), {'match': match, 'limit': limit}).all()
+
+    def search(self, session, tokens, limit):
+        # Quoted tokens are whole words, a trailing * makes them prefixes; FTS5 ANDs them.
+        ids = self._match(session, " ".join(f'"{token}"' for token in tokens), limit)
+        if len(ids) < limit:
+            prefixed = self._match(session, " ".join(f'"{token}"*' for token in tokens), limit + len(ids))
+            ids = _merge_tiers(list(ids), prefixed, limit)
+        return _rows_in_order(session, ids)
+
+    def apply(self, before, after):
+        pass  # triggers keep the FTS table in sync
+
+class MysqlFullTextSearch:
+    name = 'fts'
+
+    @staticmethod
+    def _match(session, tokens, limit, prefix):
+        conditions, params = [], {}
+        long_tokens = [token for token in tokens if len(token) >= MYSQL_MIN_TOKEN_SIZE]
+        if long_tokens:
+            conditions.append(text("MATCH (brand, model) AGAINST (:against IN BOOLEAN MODE)"))
+            params['against'] = " ".join(f"+{token}*" if prefix else f"+{token}" for token in long_tokens)
+        # Tokens too short for the FULLTEXT index use the brand and model indexes;
+        # both columns hold a single word (see phoneValidator).
+        for token in tokens:
+            if len(token) < MYSQL_MIN_TOKEN_SIZE:
+                conditions.append(or_(MobilePhone.brand.like(f"{token}%"), MobilePhone.model.like(f"{token}%"))
+                                  if prefix else or_(MobilePhone.brand == token, MobilePhone.model == token))
+        statement = select(MobilePhone.id).where(and_(*conditions)).order_by(MobilePhone.id).limit(limit)
+        return session.scalars(statement, params).all()
+
+    def search(self, session, tokens, limit):
+        ids = self._match(session, tokens, limit, prefix=False)
+        if len(ids) < limit:
+            ids = _merge_tiers(list(ids), self._match(session, tokens, limit + len(ids), prefix=True), limit)
+        return _rows_in_order(session, ids)
+
+    def apply(self, before, after):
+        pass  # InnoDB maintains FULLTEXT indexes itself
+
+class _Node:
+    __slots__ = ('children', 'ids', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []    # ids of the phones having exactly this word, ascending
+        self.count = 0   # words stored in this subtree, to pick the most selective token
+
+class PrefixTrie:
+    """Word prefix index from brand/model words to phone ids."""
+
+    def __init__(self):
+        self.root = _Node()
+        self.phones = {}   # id -> (serial_number, words)
+        self.ids = {}      # serial_number -> id
+
+    def add(self, phone_id, serial_number, brand, model):
+        if phone_id in self.phones:
+            return
+        words = frozenset(tokenize(brand) + tokenize(model))
+        self.phones[phone_id] = (serial_number, words)
+        self.ids[serial_number] = phone_id
+        for word in words:
+            node = self.root
+            node.count += 1
+            for char in word:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node()
+                node = child
+                node.count += 1
+            insort(node.ids, phone_id)
+
+    def remove(self, serial_number):
+        phone_id = self.ids.pop(serial_number, None)
+        if phone_id is None:
+            return
+        for word in self.phones.pop(phone_id)[1]:
+            node = self.root
+            node.count -= 1
+            for char in word:
+                node = node.children[char]
+                node.count -= 1
+            del node.ids[bisect_left(node.ids, phone_id)]
+
+    def _find(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    @staticmethod
+    def _subtree_ids(node):
+        # Lazily merges the id lists below node; a phone with two words under
+        # the prefix comes out twice, next to itself.
+        lists, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            if node.ids:
+                lists.append(node.ids)
+            stack.extend(node.children.values())
+        return heapq.merge(*lists)
+
+    def search(self, tokens, limit):
+        nodes = [self._find(token) for token in tokens]
+        if any(node is None or not node.count for node in nodes):
+            return []
+        found = []
+        # Whole-word matches, driven by the shortest exact id list.
+        for phone_id in min(nodes, key=lambda node: len(node.ids)).ids:
+            if all(token in self.phones[phone_id][1] for token in tokens):
+                found.append(phone_id)
+                if len(found) == limit:
+                    return found
+        # Prefix matches, driven by the token with the fewest words under it.
+        exact, previous = set(found), None
+        for phone_id in self._subtree_ids(min(nodes, key=lambda node: node.count)):
+            if phone_id == previous or phone_id in exact:
+                continue
+            previous = phone_id
+            words = self.phones[phone_id][1]
+            if all(any(word.startswith(token) for word in words) for token in tokens):
+                found.append(phone_id)
+                if len(found) == limit:
+                    break
+        return found
+
+class TrieSearch:
+    """In-process fallback, kept current by phones_changed and by polling the catalogue version.
+
+    Deletes in this process are applied as they commit. New phones, from this
+    process or others, are loaded on the next search after the catalogue
+    version moves (brand and model are immutable, so only new ids need
+    reading); phones deleted elsewhere drop out when the result rows are
+    fetched. The trie is rebuilt every rebuild_interval seconds to catch
+    anything else.
+    """
+    name = 'trie'
+
+    def __init__(self, rebuild_interval=300):
+        self.rebuild_interval = rebuild_interval
+        self.trie = None
+        self.version = None
+        self.max_id = 0
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, session, after_id=0):
+        rows = session.execute(select(MobilePhone.id, MobilePhone.serial_number, MobilePhone.brand, MobilePhone.model)
+                               .where(MobilePhone.id > after_id).order_by(MobilePhone.id))
+        for row in rows:
+            self.trie.add(row.id, row.serial_number, row.brand, row.model)
+            self.max_id = row.id
+
+    def refresh(self, session):
+        version = get_catalogue_version(session)
+        with self._lock:
+            if self.trie is None or time.monotonic() - self.built_at > self.rebuild_interval:
+                self.trie, self.max_id, self.built_at = PrefixTrie(), 0, time.monotonic()
+                self._load(session)
+            elif version != self.version:
+                self._load(session, after_id=self.max_id)
+            self.version = version
+
+    def search(self, session, tokens, limit):
+        self.refresh(session)
+        with self._lock:
+            # A few spare candidates cover phones deleted by other processes.
+            ids = self.trie.search(tokens, limit + 10)
+        phones = _rows_in_order(session, ids)
+        if len(phones) < len(ids):
+            fetched = {phone['id'] for phone in phones}
+            with self._lock:
+                for phone_id in ids:
+                    if phone_id not in fetched and phone_id in self.trie.phones:
+                        self.trie.remove(self.trie.phones[phone_id][0])
+        return phones[:limit]
+
+    def apply(self, before, after):
+        with self._lock:
+            if self.trie is None:
+                return
+            kept = {phone['serial_number'] for phone in after}
+            for phone in before:
+                if phone['serial_number'] not in kept:
+                    self.trie.remove(phone['serial_number'])
+
+def _has_fulltext_index(connection):
+    if connection.dialect.name == 'sqlite':
+        return has_fts5(connection) and inspect(connection).has_table(PHONE_FTS_TABLE)
+    if connection.dialect.name == 'mysql':
+        return any(index['name'] == PHONE_FULLTEXT_INDEX for index in inspect(connection).get_indexes('mobile_phones'))
+    return False
+
+class PhoneSearch:
+    """Picks a backend on first use, so building the app never touches the database."""
+
+    def __init__(self, backend='auto', rebuild_interval=300):
+        if backend not in ('auto', 'fts', 'trie'):
+            raise ValueError(f"Unknown search backend '{backend}'. Expected 'auto', 'fts' or 'trie'.")
+        self.requested = backend
+        self.rebuild_interval = rebuild_interval
+        self.backend = None
+
+    def _resolve(self, session):
+        connection = session.connection()
+        if self.requested != 'trie' and _has_fulltext_index(connection):
+            return SqliteFullTextSearch() if connection.dialect.name == 'sqlite' else MysqlFullTextSearch()
+        if self.requested == 'fts':
+            raise RuntimeError("No full-text index found; run `flask --app MainInterface init-db`.")
+        return TrieSearch(self.rebuild_interval)
+
+    def search(self, session, query, limit=DEFAULT_SEARCH_LIMIT):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        if self.backend is None:
+            self.backend = self._resolve(session)
+        return self.backend.search(session, tokens, limit)
+
+    def apply(self, before, after):
+        if self.backend is not None:
+            self.backend.apply(before, after)
+
+@phones_changed.connect
+def update_search_index(sender, before=(), after=()):
+    search = sender.extensions.get('phone_search')
+    if search is not None:
+        search.apply(before, after)
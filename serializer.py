@@ -0,0 +1,64 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from dbmanager import MobilePhone, PUBLIC_FIELDS, split_technologies
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used without it
+    orjson = None
+
+def select_phones(fields=PUBLIC_FIELDS):
+    # Selecting columns returns plain row tuples, skipping ORM object hydration
+    # and identity-map bookkeeping on the read-only endpoints.
+    return select(*(getattr(MobilePhone, field) for field in fields))
+
+def row_to_dict(row, fields=PUBLIC_FIELDS):
+    result = dict(zip(fields, row))
+    if 'network_technologies' in result:
+        result['network_technologies'] = split_technologies(result['network_technologies'])
+    return result
+
+def phone_etag(phone):
+    # Strong ETag of a single phone: changes whenever the row is updated, and the id
+    # keeps a re-added serial number from matching an ETag of the deleted phone.
+    return f"{phone['id']}.{phone['version']}"
+
+def dumps_bytes(obj):
+    # Encoder for code running outside a Flask app (e.g. the ASGI entry point);
+    # keys are sorted like Flask's providers so both entry points emit the same bytes.
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, installed with app.json = OrjsonProvider(app)."""
+
+    def _options(self):
+        return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options()), mimetype=self.mimetype)
+
+def get_json_provider_class(name='auto'):
+    """Map the [json] provider setting to a provider class.
+
+    'auto' uses orjson when it is installed and the stdlib encoder otherwise.
+    """
+    if name == 'default' or (name == 'auto' and orjson is None):
+        return DefaultJSONProvider
+    if name in ('orjson', 'auto'):
+        if orjson is None:
+            raise ValueError("The orjson JSON provider was requested but orjson is not installed.")
+        return OrjsonProvider
+    raise ValueError(f"Unknown JSON provider '{name}'. Expected 'auto', 'orjson' or 'default'.")
@@ -61,6 +61,13 @@ echo "MySQL is up!"
 echo "Building API image..."
 docker build -t "$API_IMAGE" .
 
+# Create/migrate the schema once; the API containers do not touch it at startup
+echo "Initialising database schema..."
+docker run --rm \
+  --network "$NETWORK_NAME" \
+  -e DATABASE_URI="$DATABASE_URI" \
+  "$API_IMAGE" flask --app MainInterface init-db
+
 # Run the API container
 echo "Starting REST API container..."
 docker run -d \
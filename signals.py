@@ -0,0 +1,9 @@
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Sent after a write to mobile_phones has been committed, with the affected
+# phones as to_dict()-shaped dicts:
+#   before: the phones as they were (empty for inserts)
+#   after:  the phones as they are now (empty for deletes)
+phones_changed = _signals.signal('phones-changed')
@@ -0,0 +1,532 @@
+"""Compact in-memory snapshot of the catalogue for read-only pods.
+
+With [snapshot] enabled = true each worker loads mobile_phones into parallel
+typed columns and answers GET /phones, /phone/<serial>, /phones/<field>/<value>
+and /phones/query from them:
+
+  id, version, imei            array('q')   IMEIs are 15 digits, kept as integers
+  serial_number                bytearray    11 ASCII bytes per phone
+  brand, model                 array('I')   codes into one interned string table
+  network_technologies         array('H')   codes into the distinct technology lists,
+                               array('B')   plus their bitmask for filtering
+  number_of_cameras            array('b')
+  cores, weight, battery       array('i')
+  cost                         array('d')
+
+serial_number has an open-addressing hash index kept in one array of
+positions; cost, weight and battery_capacity have sorted indexes (positions
+plus their values as doubles, for plain bisect), rebuilt on first use after a
+change. Positions follow id order, so id lookups and
+keyset pages are binary searches.
+
+Every refresh_interval seconds one request reads the catalogue version (a
+primary-key lookup). When it has moved, the snapshot fetches the phones whose
+changed_at lies past its own version and the deleted_phones tombstones from
+the same range, both through an index; writes made by this worker mark it
+stale so the next read catches up at once. GET /snapshot/stats reports the
+memory used per column and per phone.
+
+Strings compare by code point, as with SQLite's default collation. Other
+databases may collate differently (MySQL's default collations ignore case),
+so there the snapshot is built with exact_strings=False: filters and sorts on
+a string column go to the database, and a serial number the snapshot does not
+find is looked up there too.
+"""
+import bisect
+import itertools
+import logging
+import operator
+import sys
+import threading
+import time
+from array import array
+
+from sqlalchemy import select
+
+from dbmanager import (
+    DeletedPhone, MobilePhone, NETWORK_BITS, get_catalogue_version, network_mask, split_technologies,
+)
+from phone_query import DEFAULT_SORT, parse_criteria, parse_fields, parse_limit, parse_sort_keys
+from serializer import select_phones
+from signals import phones_changed
+
+SERIAL_WIDTH = 11
+IMEI_WIDTH = 15
+FETCH_BATCH_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+# Deleted slots are reclaimed once they exceed this share of the columns.
+COMPACT_RATIO = 0.25
+# Seconds before a snapshot that failed to load is tried again.
+RETRY_AFTER_ERROR = 60
+SORTED_FIELDS = ('cost', 'weight', 'battery_capacity')
+# Columns whose comparisons depend on the database's collation.
+STRING_FIELDS = ('serial_number', 'imei', 'brand', 'model')
+COMPARISONS = {
+    'eq': operator.eq, 'ne': operator.ne, 'lt': operator.lt,
+    'lte': operator.le, 'gt': operator.gt, 'gte': operator.ge,
+}
+# Typed columns, in the order _encode() returns their values.
+ARRAY_COLUMNS = (
+    ('ids', 'q'), ('versions', 'q'), ('imeis', 'q'), ('brands', 'I'), ('models', 'I'), ('networks', 'H'),
+    ('masks', 'B'), ('cameras', 'b'), ('cores', 'i'), ('weights', 'i'), ('batteries', 'i'), ('costs', 'd'),
+)
+COLUMN_RANGES = {'b': (-2 ** 7, 2 ** 7), 'i': (-2 ** 31, 2 ** 31)}
+
+logger = logging.getLogger('phone_api.snapshot')
+
+class SnapshotError(ValueError):
+    """A stored phone does not fit the compact columns; reads fall back to the database."""
+
+class StringTable:
+    """Interned values: each distinct one is stored once and referenced by its code."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def nbytes(self):
+        return (sys.getsizeof(self.values) + sys.getsizeof(self.codes)
+                + sum(sys.getsizeof(value) for value in self.values))
+
+def _serial_key(serial_number):
+    # None for strings that cannot be a stored serial number.
+    try:
+        key = serial_number.encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    return key if len(key) == SERIAL_WIDTH else None
+
+def _find_code(codes, code):
+    # Positions holding code, found with bytes.find over the raw column instead
+    # of a Python comparison per phone; only hits on an item boundary count.
+    data, needle, width = codes.tobytes(), array(codes.typecode, [code]).tobytes(), codes.itemsize
+    positions, offset = [], data.find(needle)
+    while offset >= 0:
+        if offset % width:
+            offset = data.find(needle, offset + 1)
+        else:
+            positions.append(offset // width)
+            offset = data.find(needle, offset + width)
+    return positions
+
+class SerialIndex:
+    """Open-addressing hash table from serial number to position, held in one int32 array."""
+
+    EMPTY = -1
+    REMOVED = -2
+
+    def __init__(self, store):
+        self.store = store
+        self.slots = array('i', [self.EMPTY]) * 8
+        self.used = 0  # slots that are not EMPTY
+
+    def find(self, key):
+        mask = len(self.slots) - 1
+        slot = hash(key) & mask
+        while True:
+            pos = self.slots[slot]
+            if pos == self.EMPTY:
+                return -1
+            if pos >= 0 and self.store.serial_bytes(pos) == key:
+                return pos
+            slot = (slot + 1) & mask
+
+    def insert(self, key, pos):
+        # Keys are unique, so a REMOVED slot on the way can be reused.
+        if (self.used + 1) * 3 > len(self.slots) * 2:
+            self.rebuild(extra=1)
+        mask = len(self.slots) - 1
+        slot = hash(key) & mask
+        while self.slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        if self.slots[slot] == self.EMPTY:
+            self.used += 1
+        self.slots[slot] = pos
+
+    def remove(self, key):
+        pos = self.find(key)
+        if pos < 0:
+            return
+        mask = len(self.slots) - 1
+        slot = hash(key) & mask
+        while self.slots[slot] != pos:
+            slot = (slot + 1) & mask
+        self.slots[slot] = self.REMOVED
+
+    def rebuild(self, extra=0):
+        # Sized for a load factor of at most 1/2 after the rebuild.
+        live = [pos for pos in self.slots if pos >= 0] if self.used else \
+            list(itertools.compress(range(len(self.store.alive)), self.store.alive))
+        capacity = 8
+        while capacity < (len(live) + extra) * 2:
+            capacity *= 2
+        self.slots = array('i', [self.EMPTY]) * capacity
+        self.used = 0
+        for pos in live:
+            self.insert(self.store.serial_bytes(pos), pos)
+
+class ColumnStore:
+    """The catalogue as parallel columns; position i of every column is one phone."""
+
+    def __init__(self, strings=None, network_lists=None):
+        for name, typecode in ARRAY_COLUMNS:
+            setattr(self, name, array(typecode))
+        self.serials = bytearray()
+        self.alive = bytearray()
+        self.deleted = 0
+        self.strings = strings or StringTable()              # brands and models
+        self.network_lists = network_lists or StringTable()  # tuples of technologies
+        self.serial_index = SerialIndex(self)
+        self.sorted = {}  # field -> (positions ordered by (value, id), their values)
+        self.getters = {
+            'id': self.ids.__getitem__,
+            'version': self.versions.__getitem__,
+            'serial_number': lambda pos: self.serial_bytes(pos).decode('ascii'),
+            'imei': lambda pos: f"{self.imeis[pos]:0{IMEI_WIDTH}d}",
+            'brand': lambda pos: self.strings.values[self.brands[pos]],
+            'model': lambda pos: self.strings.values[self.models[pos]],
+            'network_technologies': lambda pos: list(self.network_lists.values[self.networks[pos]]),
+            'number_of_cameras': self.cameras.__getitem__,
+            'number_of_cores': self.cores.__getitem__,
+            'weight': self.weights.__getitem__,
+            'battery_capacity': self.batteries.__getitem__,
+            'cost': self.costs.__getitem__,
+        }
+
+    def __len__(self):
+        return len(self.ids) - self.deleted
+
+    def serial_bytes(self, pos):
+        return bytes(self.serials[pos * SERIAL_WIDTH:(pos + 1) * SERIAL_WIDTH])
+
+    def _encode(self, row):
+        """Check a select_phones() row fits the columns and return its values in ARRAY_COLUMNS order."""
+        key = _serial_key(row.serial_number)
+        if key is None:
+            raise SnapshotError(f"serial number {row.serial_number!r} is not {SERIAL_WIDTH} ASCII characters")
+        if len(row.imei) != IMEI_WIDTH or not row.imei.isdigit():
+            raise SnapshotError(f"IMEI {row.imei!r} of {row.serial_number} is not {IMEI_WIDTH} digits")
+        technologies = split_technologies(row.network_technologies)
+        values = (row.id, row.version, int(row.imei), self.strings.code(row.brand), self.strings.code(row.model),
+                  self.network_lists.code(technologies), network_mask(technologies), row.number_of_cameras,
+                  row.number_of_cores, row.weight, row.battery_capacity, row.cost)
+        for (name, typecode), value in zip(ARRAY_COLUMNS, values):
+            low, high = COLUMN_RANGES.get(typecode, (None, None))
+            if low is not None and not low <= value < high:
+                raise SnapshotError(f"{name} value {value} of {row.serial_number} does not fit array('{typecode}')")
+        return key, values
+
+    def check(self, row):
+        self._encode(row)
+
+    def append(self, row):
+        key, values = self._encode(row)
+        for (name, _), value in zip(ARRAY_COLUMNS, values):
+            getattr(self, name).append(value)
+        self.serials += key
+        self.alive.append(1)
+        self.serial_index.insert(key, len(self.ids) - 1)
+        self.sorted.clear()
+
+    def update(self, pos, row):
+        key, values = self._encode(row)
+        if key != self.serial_bytes(pos):
+            self.serial_index.remove(self.serial_bytes(pos))
+            self.serials[pos * SERIAL_WIDTH:(pos + 1) * SERIAL_WIDTH] = key
+            self.serial_index.insert(key, pos)
+        for (name, _), value in zip(ARRAY_COLUMNS, values):
+            getattr(self, name)[pos] = value
+        self.sorted.clear()
+
+    def delete(self, pos):
+        self.serial_index.remove(self.serial_bytes(pos))
+        self.alive[pos] = 0
+        self.deleted += 1
+        self.sorted.clear()
+
+    def compacted(self):
+        """Copy of the store without the deleted slots; the string tables are shared."""
+        live = list(itertools.compress(range(len(self.alive)), self.alive))
+        store = ColumnStore(self.strings, self.network_lists)
+        for name, _ in ARRAY_COLUMNS:
+            getattr(store, name).extend(getattr(self, name)[pos] for pos in live)
+        store.serials = bytearray(b"".join(self.serial_bytes(pos) for pos in live))
+        store.alive = bytearray(b"\x01") * len(live)
+        store.serial_index.rebuild()
+        return store
+
+    def live_positions(self, start=0):
+        return itertools.compress(range(start, len(self.alive)), self.alive[start:])
+
+    def position_of_id(self, phone_id):
+        pos = bisect.bisect_left(self.ids, phone_id)
+        return pos if pos < len(self.ids) and self.ids[pos] == phone_id and self.alive[pos] else -1
+
+    def position_of_serial(self, serial_number):
+        key = _serial_key(serial_number)
+        return self.serial_index.find(key) if key is not None else -1
+
+    def sorted_index(self, field):
+        index = self.sorted.get(field)
+        if index is None:
+            # Live positions are in id order and sorting is stable, so ties stay in id order.
+            get = self.getters[field]
+            positions = array('i', sorted(self.live_positions(), key=get))
+            index = self.sorted[field] = (positions, array('d', (get(pos) for pos in positions)))
+        return index
+
+    def row(self, pos, fields):
+        getters = self.getters
+        return {field: getters[field](pos) for field in fields}
+
+    def _predicate(self, field, op, value):
+        if field == 'network_technologies':
+            bits = 0
+            for tech in value:
+                bits |= NETWORK_BITS[tech]
+            masks = self.masks
+            return lambda pos: masks[pos] & bits
+        if field in ('brand', 'model') and op in ('eq', 'ne', 'in'):
+            # Compare interned codes instead of strings.
+            codes = self.brands if field == 'brand' else self.models
+            if op == 'in':
+                wanted = {self.strings.codes[item] for item in value if item in self.strings.codes}
+                return lambda pos: codes[pos] in wanted
+            code = self.strings.codes.get(value, -1)
+            return (lambda pos: codes[pos] == code) if op == 'eq' else (lambda pos: codes[pos] != code)
+        get = self.getters[field]
+        if op == 'in':
+            wanted = set(value)
+            return lambda pos: get(pos) in wanted
+        compare = COMPARISONS[op]
+        return lambda pos: compare(get(pos), value)
+
+    def _candidates(self, criteria):
+        """Narrow the scan with an index; returns (positions in id order, criterion they satisfy or None)."""
+        for criterion in criteria:
+            field, op, value = criterion
+            if op == 'eq' and field in ('serial_number', 'id'):
+                pos = self.position_of_serial(value) if field == 'serial_number' else self.position_of_id(value)
+                return ([pos] if pos >= 0 else []), criterion
+        for criterion in criteria:
+            field, op, value = criterion
+            if field in SORTED_FIELDS and op in ('eq', 'lt', 'lte', 'gt', 'gte'):
+                index, values = self.sorted_index(field)
+                low = bisect.bisect_left(values, value) if op in ('eq', 'gte', 'lt') else None
+                high = bisect.bisect_right(values, value) if op in ('eq', 'lte', 'gt') else None
+                start, end = {'eq': (low, high), 'lt': (0, low), 'lte': (0, high),
+                              'gt': (high, len(index)), 'gte': (low, len(index))}[op]
+                return sorted(index[start:end]), criterion
+        for criterion in criteria:
+            field, op, value = criterion
+            if op == 'eq' and field in ('brand', 'model'):
+                code = self.strings.codes.get(value)
+                if code is None:
+                    return [], criterion
+                matches = _find_code(self.brands if field == 'brand' else self.models, code)
+                return [pos for pos in matches if self.alive[pos]], criterion
+        return self.live_positions(), None
+
+    def select(self, criteria, sort_keys, limit=None, fields=None):
+        positions, used = self._candidates(criteria)
+        for criterion in criteria:
+            if criterion is not used:
+                positions = filter(self._predicate(*criterion), positions)
+        positions = list(positions)
+        # Positions are in id order; stable sorts from the last key to the first
+        # give ORDER BY <keys>, id.
+        for field, descending in reversed(sort_keys):
+            positions.sort(key=self.getters[field], reverse=descending)
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.row(pos, fields) for pos in positions]
+
+class CatalogueSnapshot:
+    """One worker's snapshot, the ColumnStore it reads and the polling that keeps it current."""
+
+    def __init__(self, refresh_interval=1.0, exact_strings=True):
+        self.refresh_interval = refresh_interval
+        self.exact_strings = exact_strings  # whether the database compares strings by code point too
+        self.store = None
+        self.version = None
+        self.checked_at = 0.0
+        self.retry_at = 0.0  # earliest reload after a failed one
+        self.stale = False
+        self.error = None
+        self.counters = {"full_loads": 0, "refreshes": 0, "phones_fetched": 0, "compactions": 0}
+        self._lock = threading.Lock()          # readers vs. the refresher applying changes
+        self._refresh_lock = threading.Lock()  # one refresher at a time
+
+    def invalidate(self):
+        self.stale = True
+
+    def _due(self):
+        if self.store is None:
+            return time.monotonic() >= self.retry_at
+        return self.stale or time.monotonic() - self.checked_at >= self.refresh_interval
+
+    def current(self, session):
+        """Refresh when due and report whether the snapshot can answer reads."""
+        if self._due():
+            # The first load makes readers wait; later refreshes are skipped
+            # while another thread runs one, and the current data is served.
+            if self._refresh_lock.acquire(blocking=self.store is None):
+                try:
+                    if self._due():
+                        self._refresh(session)
+                finally:
+                    self._refresh_lock.release()
+        return self.store is not None
+
+    def _refresh(self, session):
+        self.checked_at = time.monotonic()
+        stale, self.stale = self.stale, False
+        version = get_catalogue_version(session)
+        if self.store is not None and version == self.version and not stale:
+            return
+        try:
+            if self.store is None:
+                self._load(session, version)
+            else:
+                self._apply_changes(session, version)
+        except SnapshotError as e:
+            logger.warning("Catalogue snapshot unavailable, serving reads from the database: %s", e)
+            with self._lock:
+                self.store, self.error = None, str(e)
+            self.retry_at = time.monotonic() + RETRY_AFTER_ERROR
+
+    def _load(self, session, version):
+        # The version is read first, so the data is never older than it.
+        store = ColumnStore()
+        rows = session.connection().execute(
+            select_phones().order_by(MobilePhone.id).execution_options(yield_per=FETCH_BATCH_SIZE))
+        for row in rows:
+            store.append(row)
+        with self._lock:
+            self.store, self.version, self.error = store, version, None
+        self.counters["full_loads"] += 1
+        self.counters["phones_fetched"] += len(store)
+
+    def _apply_changes(self, session, version):
+        store = self.store  # only this thread mutates it, so reading it here needs no lock
+        connection = session.connection()
+        # Both lookups use the changed_at indexes, so a refresh reads only what changed.
+        rows = {row.id: row for row in connection.execute(
+            select_phones().where(MobilePhone.changed_at > self.version, MobilePhone.changed_at <= version)
+            .order_by(MobilePhone.id))}
+        deleted_ids = connection.execute(
+            select(DeletedPhone.phone_id)
+            .where(DeletedPhone.changed_at > self.version, DeletedPhone.changed_at <= version)).scalars()
+        # A phone id that is back in the table (SQLite reuses the highest id) outlives its tombstone.
+        deleted = [pos for pos in map(store.position_of_id, set(deleted_ids) - rows.keys()) if pos >= 0]
+        changed, added = [], []
+        for phone_id in rows:
+            pos = store.position_of_id(phone_id)
+            if pos >= 0:
+                changed.append(pos)
+            else:
+                added.append(phone_id)
+
+        if added and len(store.ids) and added[0] <= store.ids[-1]:
+            # A lower id committed late (auto-increment gaps); positions must stay in id order.
+            return self._load(session, version)
+        for row in rows.values():
+            store.check(row)
+        with self._lock:
+            for pos in deleted:
+                store.delete(pos)
+            for pos in changed:
+                store.update(pos, rows[store.ids[pos]])
+            for phone_id in added:
+                store.append(rows[phone_id])
+            if store.deleted > COMPACT_RATIO * len(store.ids):
+                self.store = store.compacted()
+                self.counters["compactions"] += 1
+            self.version = version
+        self.counters["refreshes"] += 1
+        self.counters["phones_fetched"] += len(rows)
+
+    # Reads; each holds the lock so it never sees a half-applied refresh.
+
+    def phone(self, serial_number, fields=None):
+        with self._lock:
+            pos = self.store.position_of_serial(serial_number)
+            return self.store.row(pos, fields or self.store.getters) if pos >= 0 else None
+
+    def page(self, after, limit):
+        """Up to limit phones with an id above after, in id order."""
+        with self._lock:
+            store = self.store
+            start = bisect.bisect_right(store.ids, after)
+            return [store.row(pos, store.getters) for pos in itertools.islice(store.live_positions(start), limit)]
+
+    def stream(self, dumps, after=0):
+        # Phones above after as a JSON array, built a batch at a time so a slow
+        # client does not hold up refreshes.
+        yield "["
+        first = True
+        while True:
+            phones = self.page(after, STREAM_BATCH_SIZE)
+            for phone in phones:
+                yield ("" if first else ",") + dumps(phone)
+                first = False
+            if len(phones) < STREAM_BATCH_SIZE:
+                break
+            after = phones[-1]['id']
+        yield "]"
+
+    def select(self, criteria, sort_keys=None, limit=None, fields=None):
+        """Matching phones, or None when the database could match or order them differently."""
+        if sort_keys is None:
+            sort_keys = [(field, False) for field in DEFAULT_SORT]
+        fields_compared = [criterion[0] for criterion in criteria] + [field for field, _ in sort_keys]
+        if not self.exact_strings and any(field in STRING_FIELDS for field in fields_compared):
+            return None
+        with self._lock:
+            return self.store.select(criteria, sort_keys, limit, fields or list(self.store.getters))
+
+    def query(self, args):
+        """Answer /phones/query parameters like select(); raises ValueError like phone_query.build_query."""
+        fields = parse_fields(args.get('fields'))
+        return self.select(parse_criteria(args), parse_sort_keys(args.get('sort')), parse_limit(args.get('limit')),
+                           fields)
+
+    def memory(self):
+        """Bytes held per column and per phone."""
+        with self._lock:
+            store = self.store
+            columns = {name: sys.getsizeof(getattr(store, name)) for name, _ in ARRAY_COLUMNS}
+            columns.update(
+                serials=sys.getsizeof(store.serials),
+                alive=sys.getsizeof(store.alive),
+                strings=store.strings.nbytes(),
+                network_lists=store.network_lists.nbytes(),
+                serial_index=sys.getsizeof(store.serial_index.slots),
+                sorted_indexes=sum(sys.getsizeof(positions) + sys.getsizeof(values)
+                                   for positions, values in store.sorted.values()),
+            )
+            rows = len(store)
+            total = sum(columns.values())
+            return {"phones": rows, "deleted_slots": store.deleted, "distinct_strings": len(store.strings.values),
+                    "bytes": columns, "total_bytes": total,
+                    "bytes_per_phone": round(total / rows, 1) if rows else None}
+
+    def stats(self):
+        stats = dict(self.counters, version=self.version, refresh_interval=self.refresh_interval, error=self.error)
+        if self.store is not None:
+            stats["memory"] = self.memory()
+        return stats
+
+@phones_changed.connect
+def mark_snapshot_stale(sender, before=(), after=()):
+    # Writes served by this worker show up on its next read.
+    snapshot = sender.extensions.get('catalogue_snapshot')
+    if snapshot is not None:
+        snapshot.invalidate()
@@ -0,0 +1,152 @@
+import unittest
+import json
+import os
+import tempfile
+
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+from asgi_app import PhoneAPI
+
+class AsgiTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Each test gets its own SQLite file served through aiosqlite
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.api = PhoneAPI(f"sqlite+aiosqlite:///{os.path.join(self.tmpdir.name, 'test.db')}",
+                            create_schema=True)
+        await self.api.startup()
+
+    async def asyncTearDown(self):
+        await self.api.shutdown()
+        self.tmpdir.cleanup()
+
+    # Drive one request through the ASGI interface and collect the response
+    async def request(self, method, path, body=None, headers=None):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query.encode(),
+            'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        }
+        payload = json.dumps(body).encode() if body is not None else b''
+        messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+        response = {'body': b''}
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {k.decode(): v.decode() for k, v in message['headers']}
+            else:
+                response['body'] += message.get('body', b'')
+
+        await self.api(scope, receive, send)
+        return response
+
+    async def test_crud_and_filters(self):
+        payload = {
+            "serial_number": "ASY12345678",
+            "imei": "123456789012345",
+            "model": "X100",
+            "brand": "Nokia",
+            "network_technologies": ["GSM", "LTE"],
+            "number_of_cameras": 2,
+            "number_of_cores": 4,
+            "weight": 150,
+            "battery_capacity": 3000,
+            "cost": 299.99
+        }
+        response = await self.request('POST', '/add_phone', payload)
+        self.assertEqual(response['status'], 201)
+
+        response = await self.request('POST', '/add_phone', payload)
+        self.assertEqual(response['status'], 400)
+        self.assertIn("already exists", response['body'].decode())
+
+        # Streamed list, keyset page and single lookup
+        response = await self.request('GET', '/phones')
+        self.assertEqual([p['serial_number'] for p in json.loads(response['body'])], ["ASY12345678"])
+        response = await self.request('GET', '/phones?limit=1')
+        self.assertEqual(response['headers']['x-next-after'], '1')
+        response = await self.request('GET', f"/phone/{payload['serial_number']}")
+        self.assertEqual(json.loads(response['body'])['network_technologies'], ["GSM", "LTE"])
+
+        # Field filter and conditional GET
+        response = await self.request('GET', '/phones/network_technologies/LTE')
+        self.assertEqual(len(json.loads(response['body'])), 1)
+        etag = response['headers']['etag']
+        response = await self.request('GET', '/phones/network_technologies/LTE', headers={'If-None-Match': etag})
+        self.assertEqual(response['status'], 304)
+
+        response = await self.request('GET', '/phones/stats?dimension=brand')
+        self.assertEqual(json.loads(response['body'])['brand'][0]['count'], 1)
+        response = await self.request('GET', f"/phones/search?q={payload['brand'][:3]}")
+        self.assertEqual([phone['serial_number'] for phone in json.loads(response['body'])], [payload['serial_number']])
+
+        # Update and delete; If-Match with the ETag read before the update is stale afterwards
+        etag = (await self.request('GET', f"/phone/{payload['serial_number']}"))['headers']['etag']
+        response = await self.request('PUT', f"/update_phone/{payload['serial_number']}", {"cost": 199.0})
+        self.assertEqual(json.loads(response['body'])['cost'], 199.0)
+        response = await self.request('PUT', f"/update_phone/{payload['serial_number']}", {"cost": 99.0},
+                                      headers={'If-Match': etag})
+        self.assertEqual(response['status'], 412)
+        response = await self.request('PUT', f"/update_phone/{payload['serial_number']}", {"brand": "Other"})
+        self.assertEqual(response['status'], 400)
+        response = await self.request('DELETE', f"/delete_phone/{payload['serial_number']}",
+                                      headers={'If-Match': etag})
+        self.assertEqual(response['status'], 412)
+        etag = (await self.request('GET', f"/phone/{payload['serial_number']}"))['headers']['etag']
+        # catalogue_state is locked before the phone row, as on every write path
+        locks = []
+        def record(conn, statement, multiparams, params, execution_options):
+            if isinstance(statement, UpdateBase):
+                locks.append(statement.table.name)
+            elif getattr(statement, '_for_update_arg', None) is not None:
+                locks.append("SELECT FOR UPDATE")
+        event.listen(self.api.engine.sync_engine, 'before_execute', record)
+        response = await self.request('DELETE', f"/delete_phone/{payload['serial_number']}",
+                                      headers={'If-Match': etag})
+        event.remove(self.api.engine.sync_engine, 'before_execute', record)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(locks[:2], ['catalogue_state', 'SELECT FOR UPDATE'])
+        response = await self.request('GET', f"/phone/{payload['serial_number']}")
+        self.assertEqual(response['status'], 404)
+        response = await self.request('GET', '/phones/stats')
+        self.assertEqual(json.loads(response['body'])['brand'], [])
+
+    async def test_idempotency_key(self):
+        payload = {"serial_number": "IDA12345678", "imei": "223456789012345", "model": "X100", "brand": "Nokia",
+                   "network_technologies": ["LTE"], "number_of_cameras": 2, "number_of_cores": 4, "weight": 150,
+                   "battery_capacity": 3000, "cost": 299.99}
+        key = {'Idempotency-Key': 'asgi-add'}
+        first = await self.request('POST', '/add_phone', payload, headers=key)
+        self.assertEqual(first['status'], 201)
+
+        # The retry replays the stored response instead of failing as a duplicate
+        retry = await self.request('POST', '/add_phone', payload, headers=key)
+        self.assertEqual(retry['status'], 201)
+        self.assertEqual(retry['headers']['idempotent-replayed'], 'true')
+        self.assertEqual(retry['headers']['content-type'], 'application/json')
+        self.assertEqual(retry['headers']['etag'], first['headers']['etag'])
+        self.assertEqual(json.loads(retry['body']), json.loads(first['body']))
+
+        response = await self.request('POST', '/add_phone', dict(payload, cost=1.0), headers=key)
+        self.assertEqual(response['status'], 422)
+        response = await self.request('PUT', '/update_phone/IDA12345678', {"cost": 1.0},
+                                      headers={'Idempotency-Key': ''})
+        self.assertEqual(response['status'], 400)
+
+        # Updates run once per key
+        key = {'Idempotency-Key': 'asgi-update'}
+        for _ in range(2):
+            response = await self.request('PUT', '/update_phone/IDA12345678', {"cost": 199.0}, headers=key)
+            self.assertEqual(response['status'], 200)
+        response = await self.request('GET', '/phone/IDA12345678')
+        self.assertEqual(json.loads(response['body'])['version'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,263 @@
+"""Write-behind ingestion for POST /add_phone.
+
+With [write_behind] mode = prefer (clients send "Prefer: respond-async") or
+always, /add_phone validates the phone, queues it and answers 202 with a
+tracking id instead of waiting for its own commit. A background thread in
+each worker drains the queue in groups: it waits at most max_latency_ms
+after the first queued phone, or until max_batch phones are waiting, and
+writes the group through bulk_ingest.ingest_phones, one multi-row INSERT
+and one commit for the lot. A phone that clashes with an existing serial
+number or IMEI is rejected on its own without failing the rest.
+
+GET /ingest/<tracking_id> reports queued, inserted or rejected (with the
+errors). Statuses live in a cache from cache.py, so `status_backend = shared`
+lets any worker answer for any other.
+
+With journal_dir set, every accepted phone is appended to a per-worker
+NDJSON journal before the 202 is sent, and committed groups are marked in
+it. A worker starting up replays the journals of workers that died, so
+queued phones survive a crash; a phone whose commit landed just before the
+crash is then rejected as a duplicate rather than written twice.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from bulk_ingest import ingest_phones
+from serializer import dumps_bytes
+
+logger = logging.getLogger('phone_api.write_behind')
+
+JOURNAL_PATTERN = 'write-behind-*.ndjson'
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class Journal:
+    """Append-only log of the phones queued by one worker process."""
+
+    def __init__(self, directory, fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+        self.path = os.path.join(directory, f"write-behind-{os.getpid()}.ndjson")
+        self.pending = set()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def recover(self):
+        """Claim the journals of dead workers (and a stale one of our pid) and return their unwritten phones."""
+        records = []
+        for path in sorted(glob.glob(os.path.join(self.directory, JOURNAL_PATTERN))):
+            pid = os.path.basename(path)[len('write-behind-'):-len('.ndjson')]
+            if not pid.isdigit() or (int(pid) != os.getpid() and _pid_alive(int(pid))):
+                continue
+            claimed = f"{path}.recovering-{os.getpid()}"
+            try:
+                os.rename(path, claimed)  # atomic, so only one worker replays each journal
+            except FileNotFoundError:
+                continue
+            queued = {}
+            with open(claimed) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line from the crash
+                    if 'record' in entry:
+                        queued[entry['id']] = entry['record']
+                    for tracking_id in entry.get('done', ()):
+                        queued.pop(tracking_id, None)
+            records.extend(queued.items())
+            os.remove(claimed)
+        return records
+
+    def _write(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def append(self, tracking_id, record):
+        with self._lock:
+            self._write({"id": tracking_id, "record": record})
+            self.pending.add(tracking_id)
+
+    def done(self, tracking_ids):
+        with self._lock:
+            self.pending.difference_update(tracking_ids)
+            if self.pending:
+                self._write({"done": list(tracking_ids)})
+            else:
+                # Nothing left to replay; start the file afresh so it never grows unbounded.
+                open(self.path, 'w').close()
+
+class WriteBehind:
+    """Bounded per-worker queue of phones plus the thread that group-commits them."""
+
+    def __init__(self, app, statuses, max_size=10000, max_batch=500, max_latency_ms=20,
+                 journal_dir=None, fsync=False):
+        self.app = app
+        self.statuses = statuses
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.queue = queue.Queue(maxsize=max_size)
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.journal = None
+        self.counters = {"accepted": 0, "inserted": 0, "rejected": 0, "batches": 0, "failed_batches": 0}
+        self._pid = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the writer in the current process (threads do not survive gunicorn's fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._stopping.clear()
+            recovered = []
+            if self.journal_dir:
+                self.journal = Journal(self.journal_dir, self.fsync)
+                recovered = self.journal.recover()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+        if recovered:
+            logger.warning("Replaying %d queued phones from the journals of stopped workers.", len(recovered))
+        for tracking_id, record in recovered:
+            # Blocks rather than drops when the backlog exceeds the queue size.
+            self._enqueue(tracking_id, record, block=True)
+
+    def _set_status(self, tracking_id, status, record, errors=None):
+        entry = {"id": tracking_id, "status": status, "serial_number": record.get('serial_number')}
+        if errors:
+            entry["errors"] = errors
+        self.statuses.set(tracking_id, dumps_bytes(entry))
+
+    def _enqueue(self, tracking_id, record, block=False):
+        if self.journal is not None:
+            self.journal.append(tracking_id, record)
+        # Set before the writer can see the phone, so "queued" never overwrites its outcome.
+        self._set_status(tracking_id, "queued", record)
+        try:
+            self.queue.put((tracking_id, record), block=block)
+        except queue.Full:
+            self.statuses.delete(tracking_id)
+            if self.journal is not None:
+                self.journal.done([tracking_id])
+            raise
+
+    def submit(self, record):
+        """Queue one validated phone; returns its tracking id or raises queue.Full."""
+        self.ensure_started()
+        tracking_id = uuid.uuid4().hex
+        self._enqueue(tracking_id, record)
+        with self._lock:
+            self.counters["accepted"] += 1
+        return tracking_id
+
+    def status(self, tracking_id):
+        entry = self.statuses.get(tracking_id)
+        return json.loads(entry) if entry is not None else None
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return None
+        # Group commit: give concurrent requests max_latency to join the batch.
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        delay = 0.1
+        while True:
+            written = []
+            try:
+                with self.app.app_context():
+                    report = ingest_phones([record for _, record in batch], chunk_size=len(batch), atomic=False,
+                                           written=written)
+                break
+            except Exception:
+                # Typically the database is unreachable; the phones stay queued (and journaled).
+                # Those committed before the failure are done, so only the rest are retried.
+                self.counters["failed_batches"] += 1
+                self._finish([batch[index] for index in written], {})
+                written = set(written)
+                batch = [item for index, item in enumerate(batch) if index not in written]
+                logger.exception("Write-behind batch failed with %d phones unwritten; retrying in %.1fs",
+                                 len(batch), delay)
+                if not batch or self._stopping.is_set():
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+        self._finish(batch, {error['index']: error['errors'] for error in report['errors']})
+        self.counters["batches"] += 1
+
+    def _finish(self, batch, errors):
+        for index, (tracking_id, record) in enumerate(batch):
+            if index in errors:
+                self._set_status(tracking_id, "rejected", record, errors[index])
+                self.counters["rejected"] += 1
+            else:
+                self._set_status(tracking_id, "inserted", record)
+                self.counters["inserted"] += 1
+        if self.journal is not None and batch:
+            self.journal.done([tracking_id for tracking_id, _ in batch])
+
+    def wait(self):
+        """Block until every phone queued so far has been written or rejected."""
+        self.queue.join()
+
+    def stop(self, timeout=10):
+        # Drains the queue before returning, so a clean shutdown loses nothing.
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        stats = dict(self.counters, queued=self.queue.qsize(), max_size=self.queue.maxsize,
+                     max_batch=self.max_batch, max_latency_ms=self.max_latency * 1000,
+                     journal=self.journal.path if self.journal is not None else None)
+        if stats["batches"]:
+            stats["average_batch"] = round((stats["inserted"] + stats["rejected"]) / stats["batches"], 1)
+        return stats